@@ -0,0 +1,178 @@
+import os
+from jwtlib import LazyClient
+from jwtlib.batch import batch_get, batch_write
+
+USER_POOL_ID = os.environ.get("USER_POOL_ID")
+AWS_REGION = os.environ.get("AWS_REGION")
+TABLE_PREFIX = os.environ.get("TABLE_PREFIX", "RunaVault_")
+PASSWORDS_TABLE = f"{TABLE_PREFIX}passwords"
+ACCESS_TABLE = f"{TABLE_PREFIX}access"
+GROUPS_INDEX = os.environ.get("GROUPS_INDEX", "shared_with_groups-lean-index")
+
+dynamodb = LazyClient("dynamodb")
+cognito = LazyClient("cognito-idp", region_name=AWS_REGION)
+
+# The access view holds a copy of every passwords row under each user who
+# can see it: recipient is the user's sub, entry_key is
+# "{via}#{owner}#{site}" where via is "owner", "user" or "group:{name}".
+# list_secrets reads a user's whole vault with one query on it.
+
+
+def entry_key(via, row):
+    return f"{via}#{row['user_id']['S']}#{row['site']['S']}"
+
+
+class Members:
+    """Cognito lookups, memoized for one invocation."""
+
+    def __init__(self):
+        self._groups = {}
+        self._subs = {}
+
+    def of_group(self, group):
+        members = self._groups.get(group)
+        if members is None:
+            members = self._groups[group] = []
+            params = {"UserPoolId": USER_POOL_ID, "GroupName": group}
+            while True:
+                try:
+                    response = cognito.list_users_in_group(**params)
+                except Exception as e:
+                    if getattr(e, "response", {}).get("Error", {}).get("Code") == "ResourceNotFoundException":
+                        break
+                    raise
+                for user in response.get("Users", []):
+                    sub = next((a["Value"] for a in user.get("Attributes", []) if a["Name"] == "sub"), None)
+                    if sub:
+                        members.append(sub)
+                if not response.get("NextToken"):
+                    break
+                params["NextToken"] = response["NextToken"]
+        return members
+
+    def sub(self, username):
+        sub = self._subs.get(username)
+        if sub is None:
+            response = cognito.admin_get_user(UserPoolId=USER_POOL_ID, Username=username)
+            sub = self._subs[username] = next(
+                a["Value"] for a in response.get("UserAttributes", []) if a["Name"] == "sub"
+            )
+        return sub
+
+
+def recipients(row, members):
+    """(recipient, via) pairs for everyone who can see ``row``."""
+    pairs = {(row["user_id"]["S"], "owner")}
+    user = row.get("shared_with_users", {}).get("S")
+    if user and user != "NONE":
+        pairs.add((user, "user"))
+    group = row.get("shared_with_groups", {}).get("S")
+    if group and group != "NONE":
+        pairs.update((member, f"group:{group}") for member in members.of_group(group))
+    return pairs
+
+
+def access_entry(recipient, via, row):
+    return {
+        **row,
+        "recipient": {"S": recipient},
+        "entry_key": {"S": entry_key(via, row)},
+        "via": {"S": via},
+    }
+
+
+class ViewWrites:
+    """Puts and deletes for the access table, last write per key wins."""
+
+    def __init__(self):
+        self._requests = {}
+
+    def put(self, item):
+        self._requests[(item["recipient"]["S"], item["entry_key"]["S"])] = {"PutRequest": {"Item": item}}
+
+    def delete(self, recipient, key):
+        self._requests[(recipient, key)] = {
+            "DeleteRequest": {"Key": {"recipient": {"S": recipient}, "entry_key": {"S": key}}}
+        }
+
+    def flush(self):
+        requests = list(self._requests.values())
+        batch_write(dynamodb, ACCESS_TABLE, requests)
+        self._requests.clear()
+        return len(requests)
+
+
+def apply_stream_records(records, members):
+    """Mirror passwords-table changes into the access view.
+
+    Recipients of the old image that are not recipients of the new one
+    lose their entry; every recipient of the new image gets a fresh copy.
+    """
+    writes = ViewWrites()
+    for record in records:
+        images = record.get("dynamodb", {})
+        old = images.get("OldImage")
+        new = images.get("NewImage")
+        new_pairs = recipients(new, members) if new else set()
+        if old:
+            for recipient, via in recipients(old, members) - new_pairs:
+                writes.delete(recipient, entry_key(via, old))
+        for recipient, via in new_pairs:
+            writes.put(access_entry(recipient, via, new))
+    return writes.flush()
+
+
+def query_all(**params):
+    while True:
+        response = dynamodb.query(**params)
+        yield from response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            return
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def full_rows(rows):
+    """The table items behind GSI rows, which only carry list-view attributes."""
+    keys = [{"user_id": row["user_id"], "site": row["site"]} for row in rows]
+    return batch_get(dynamodb, PASSWORDS_TABLE, keys)
+
+
+def apply_membership(event, members):
+    """Add or drop the group-shared entries of users who joined or left groups."""
+    writes = ViewWrites()
+    subs = [members.sub(username) for username in event.get("usernames", [])]
+    for group in event.get("added", []):
+        rows = full_rows(list(query_all(
+            TableName=PASSWORDS_TABLE,
+            IndexName=GROUPS_INDEX,
+            KeyConditionExpression="shared_with_groups = :group",
+            ExpressionAttributeValues={":group": {"S": group}},
+        )))
+        for sub in subs:
+            for row in rows:
+                writes.put(access_entry(sub, f"group:{group}", row))
+    for group in event.get("removed", []):
+        for sub in subs:
+            for entry in query_all(
+                TableName=ACCESS_TABLE,
+                KeyConditionExpression="recipient = :recipient AND begins_with(entry_key, :via)",
+                ExpressionAttributeValues={
+                    ":recipient": {"S": sub},
+                    ":via": {"S": f"group:{group}#"},
+                },
+                ProjectionExpression="recipient, entry_key",
+            ):
+                writes.delete(sub, entry["entry_key"]["S"])
+    return writes.flush()
+
+
+def lambda_handler(event, context):
+    members = Members()
+    if event.get("type") == "membership":
+        count = apply_membership(event, members)
+        print(f"Membership change for {len(event.get('usernames', []))} users: {count} view writes")
+    else:
+        records = event.get("Records", [])
+        count = apply_stream_records(records, members)
+        print(f"Applied {len(records)} stream records: {count} view writes")
+    return {"writes": count}
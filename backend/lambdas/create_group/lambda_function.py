@@ -1,20 +1,25 @@
 import os
-import boto3
 import logging
-from jwtlib import get_auth_token, verify_token, parse_body, format_response
+from jwtlib import get_claims, parse_body, format_response, LazyClient, ValidationError, compile_schema
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
-cognito_client = boto3.client("cognito-idp")
+cognito_client = LazyClient("cognito-idp")
+
+validate_body = compile_schema({
+    "groupName": {"type": str, "required": True, "max_length": 128},
+    "description": {"type": str, "max_length": 2048},
+    "precedence": {"type": int},
+    "roleArn": {"type": str, "max_length": 2048},
+}, max_body_length=8 * 1024)
 
 def lambda_handler(event, context):
     try:
         logger.info("Received event for group creation")
 
-        token = get_auth_token(event)
-        decoded_token = verify_token(token)
+        decoded_token = get_claims(event)
         logger.info("Token verified")
 
         user_groups = decoded_token.get("cognito:groups", [])
@@ -24,7 +29,7 @@ def lambda_handler(event, context):
                 "message": "Forbidden: Only Admin users can perform this action"
             })
 
-        body = parse_body(event.get("body", "{}"))
+        body = parse_body(event.get("body", "{}"), schema=validate_body)
         group_name = body.get("groupName")
         description = body.get("description")
         precedence = body.get("precedence")
@@ -56,6 +61,8 @@ def lambda_handler(event, context):
             "message": "Group created successfully"
         })
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as e:
         logger.exception("Failed to create group")
         status_code = 401 if "Unauthorized" in str(e) else 500
@@ -1,22 +1,37 @@
 import os
-import json
 import uuid
-import boto3
-from botocore.exceptions import ClientError
-from jwtlib import verify_token, format_response, parse_body, get_auth_token
+from jwtlib import get_claims, format_response, parse_body, codec, LazyClient, BatchWriter, ValidationError, compile_schema, SHARED_WITH_SPEC, change_audiences, record_changes, bump_group_revisions, share_attributes
 from datetime import datetime, timezone
 
-dynamodb = boto3.client('dynamodb')
+dynamodb = LazyClient('dynamodb')
 TABLE_PREFIX = os.getenv('TABLE_PREFIX', 'RunaVault_')
+CHANGES_TABLE = f"{TABLE_PREFIX}changes"
+REVISIONS_TABLE = f"{TABLE_PREFIX}revisions"
 MAX_NOTES_LENGTH = 500
 
+# The password is ciphertext and the sharedWith IDs become key parts, so
+# parse_body leaves them as sent.
+UNESCAPED_FIELDS = frozenset({'password', 'sharedWith'})
+
+validate_body = compile_schema({
+    'site': {'type': str, 'required': True, 'max_length': 2048},
+    'username': {'type': str, 'required': True, 'max_length': 512},
+    'password': {'type': (str, dict), 'required': True},
+    'encrypted': {'type': bool},
+    'sharedWith': SHARED_WITH_SPEC,
+    'subdirectory': {'type': str, 'max_length': 256},
+    'notes': {'type': str, 'max_length': MAX_NOTES_LENGTH},
+    'tags': {'type': list, 'max_items': 50, 'items': {'type': str, 'max_length': 64}},
+    'favorite': {'type': bool},
+    'version': {'type': int},
+}, max_body_length=256 * 1024)
+
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded = verify_token(token)
+        decoded = get_claims(event)
         user_id = decoded['sub']
 
-        body = parse_body(event.get('body', '{}'))
+        body = parse_body(event.get('body', '{}'), skip_fields=UNESCAPED_FIELDS, schema=validate_body)
         site = body.get('site')
         username = body.get('username')
         raw_password = body.get('password')
@@ -33,14 +48,9 @@ def lambda_handler(event, context):
                 "message": "Missing required parameters: site, username, and password are required"
             })
 
-        if notes and len(notes) > MAX_NOTES_LENGTH:
-            return format_response(400, {
-                "message": f"Notes cannot exceed {MAX_NOTES_LENGTH} characters"
-            })
-
         try:
             if isinstance(raw_password, str) and raw_password.startswith("{"):
-                password_data = json.loads(raw_password)
+                password_data = codec.loads(raw_password)
             elif isinstance(raw_password, dict):
                 password_data = raw_password
             else:
@@ -52,7 +62,7 @@ def lambda_handler(event, context):
             print("Failed to parse password:", e)
             return format_response(400, {"message": "Invalid password format"})
 
-        password_str = json.dumps(password_data) if isinstance(password_data, dict) else password_data
+        password_str = codec.dumps(password_data) if isinstance(password_data, dict) else password_data
         last_modified = datetime.now(timezone.utc).isoformat()
         password_id = str(uuid.uuid4())
 
@@ -78,62 +88,30 @@ def lambda_handler(event, context):
 
         groups = shared_with.get('groups', []) or ["NONE"]
         users = shared_with.get('users', []) or ["NONE"]
-        put_promises = []
-
-        for group in groups:
-            composite_key = f"{base_composite_key}#group:{group}"
-            item = {
-                **base_item,
-                'site': {'S': composite_key},
-                'shared_with_groups': {'S': group},
-                'shared_with_users': {'S': "NONE"},
-            }
-            try:
-                dynamodb.put_item(
-                    TableName=f"{TABLE_PREFIX}passwords",
-                    Item=item,
-                    ConditionExpression="attribute_not_exists(user_id) AND attribute_not_exists(site)"
-                )
-            except ClientError as e:
-                if e.response['Error']['Code'] == "ConditionalCheckFailedException":
-                    raise Exception(f"An item with user_id {user_id} and site {composite_key} already exists for group {group}")
-                else:
-                    raise
-
-        for shared_user in users:
-            composite_key = f"{base_composite_key}#user:{shared_user}"
-            item = {
-                **base_item,
-                'site': {'S': composite_key},
-                'shared_with_groups': {'S': "NONE"},
-                'shared_with_users': {'S': shared_user},
-            }
-            try:
-                dynamodb.put_item(
-                    TableName=f"{TABLE_PREFIX}passwords",
-                    Item=item,
-                    ConditionExpression="attribute_not_exists(user_id) AND attribute_not_exists(site)"
-                )
-            except ClientError as e:
-                if e.response['Error']['Code'] == "ConditionalCheckFailedException":
-                    raise Exception(f"An item with user_id {user_id} and site {composite_key} already exists for user {shared_user}")
-                else:
-                    raise
-
-        # Retrieve one of the inserted items for confirmation
-        first_key = (
-            f"{base_composite_key}#group:{groups[0]}" if groups[0] != "NONE"
-            else f"{base_composite_key}#user:{users[0]}"
-        )
 
-        response = dynamodb.get_item(
-            TableName=f"{TABLE_PREFIX}passwords",
-            Key={'user_id': {'S': user_id}, 'site': {'S': first_key}}
+        # The keys include a fresh password_id, so the rows cannot exist yet
+        # and all of them go out unconditionally in a few BatchWriteItem calls.
+        writer = BatchWriter(dynamodb, f"{TABLE_PREFIX}passwords")
+        rows = [
+            {**base_item, 'site': {'S': f"{base_composite_key}#group:{group}"}, **share_attributes(group=group)}
+            for group in groups
+        ] + [
+            {**base_item, 'site': {'S': f"{base_composite_key}#user:{shared_user}"}, **share_attributes(user=shared_user)}
+            for shared_user in users
+        ]
+        for row in rows:
+            writer.put(row)
+        writer.flush()
+        print(f"Wrote {len(rows)} rows for {password_id}, {writer.units} WCU")
+
+        record_changes(
+            dynamodb, CHANGES_TABLE, user_id, password_id, base_composite_key,
+            upserted=change_audiences(user_id, users, groups),
         )
+        bump_group_revisions(dynamodb, REVISIONS_TABLE, groups)
 
-        item = response.get('Item')
-        if not item:
-            return format_response(404, {"message": "Password not found after creation"})
+        # Echo the first row written: a real share when there is one.
+        item = rows[0] if groups[0] != "NONE" else rows[len(groups)]
 
         return format_response(200, {
             "site": item["site"]["S"],
@@ -154,6 +132,8 @@ def lambda_handler(event, context):
             "password_id": item["password_id"]["S"],
         })
 
+    except ValidationError as e:
+        return format_response(400, {'message': str(e)})
     except Exception as e:
         print("Error:", e)
         message = str(e)
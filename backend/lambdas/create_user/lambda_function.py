@@ -1,7 +1,6 @@
 import os
-import boto3
 import logging
-from jwtlib import verify_token, get_auth_token, parse_body, format_response
+from jwtlib import get_claims, parse_body, format_response, LazyClient, ValidationError, compile_schema
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,13 +8,18 @@ logger.setLevel(logging.INFO)
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 AWS_REGION = os.environ.get("AWS_REGION")
 
-cognito = boto3.client("cognito-idp", region_name=AWS_REGION)
+cognito = LazyClient("cognito-idp", region_name=AWS_REGION)
+
+validate_body = compile_schema({
+    "email": {"type": str, "required": True, "max_length": 254},
+    "given_name": {"type": str, "max_length": 128},
+    "family_name": {"type": str, "max_length": 128},
+}, max_body_length=4 * 1024)
 
 def lambda_handler(event, context):
     try:
         logger.info("Received event")
-        token = get_auth_token(event)
-        decoded_token = verify_token(token)
+        decoded_token = get_claims(event)
         logger.info("Token verified")
 
         user_groups = decoded_token.get("cognito:groups", [])
@@ -27,7 +31,7 @@ def lambda_handler(event, context):
                 "message": "Forbidden: Only Admin users can perform this action"
             })
 
-        parsed_body = parse_body(event.get("body", "{}"))
+        parsed_body = parse_body(event.get("body", "{}"), schema=validate_body)
         email = parsed_body.get("email")
         given_name = parsed_body.get("given_name")
         family_name = parsed_body.get("family_name")
@@ -61,6 +65,8 @@ def lambda_handler(event, context):
             "message": f"{email} user created successfully"
         })
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as e:
         logger.exception("Failed to create user")
         status_code = 401 if "Unauthorized" in str(e) else 400
@@ -1,24 +1,26 @@
 import os
-import boto3
 import logging
-from jwtlib import get_auth_token, verify_token, parse_body, format_response
+from jwtlib import get_claims, parse_body, format_response, LazyClient, ValidationError, compile_schema, publish_membership_change
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
-cognito = boto3.client("cognito-idp")
+cognito = LazyClient("cognito-idp")
+
+validate_body = compile_schema({
+    "groupName": {"type": str, "required": True, "max_length": 128},
+}, max_body_length=4 * 1024)
 
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded_token = verify_token(token)
+        decoded_token = get_claims(event)
 
         user_groups = decoded_token.get("cognito:groups", [])
         if "Admin" not in user_groups:
             return format_response(403, {"message": "Forbidden: Only Admin users can perform this action"})
 
-        body = parse_body(event.get("body", "{}"))
+        body = parse_body(event.get("body", "{}"), schema=validate_body)
         group_name = body.get("groupName")
 
         if not group_name:
@@ -27,17 +29,30 @@ def lambda_handler(event, context):
         if group_name.lower() == "admin":
             return format_response(400, {"message": "Cannot delete the Admin group"})
 
+        # Deleting the group drops its memberships, so collect them first.
+        members = []
+        params = {"UserPoolId": USER_POOL_ID, "GroupName": group_name}
+        while True:
+            response = cognito.list_users_in_group(**params)
+            members.extend(user["Username"] for user in response.get("Users", []))
+            if not response.get("NextToken"):
+                break
+            params["NextToken"] = response["NextToken"]
+
         cognito.delete_group(
             GroupName=group_name,
             UserPoolId=USER_POOL_ID
         )
 
-        return format_response(200, {"message": "Group deleted successfully"})
+        publish_membership_change(members, removed=[group_name])
 
-    except cognito.exceptions.ResourceNotFoundException:
-        return format_response(404, {"message": "Group not found"})
+        return format_response(200, {"message": "Group deleted successfully"})
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") == "ResourceNotFoundException":
+            return format_response(404, {"message": "Group not found"})
         logger.exception("Error while deleting group")
         status_code = 401 if "Unauthorized" in str(e) else 500
         return format_response(status_code, {"message": str(e)})
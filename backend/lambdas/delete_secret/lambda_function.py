@@ -1,17 +1,25 @@
 import os
-import boto3
-from jwtlib import verify_token, format_response, parse_body, get_auth_token
+from jwtlib import get_claims, format_response, parse_body, LazyClient, BatchWriter, ValidationError, compile_schema, change_audiences, record_changes, bump_group_revisions
 
-dynamodb = boto3.client('dynamodb')
+dynamodb = LazyClient('dynamodb')
 TABLE_PREFIX = os.environ.get("TABLE_PREFIX", "RunaVault_")
+CHANGES_TABLE = f"{TABLE_PREFIX}changes"
+REVISIONS_TABLE = f"{TABLE_PREFIX}revisions"
+# user_id has to match the stored key exactly.
+UNESCAPED_FIELDS = frozenset({"user_id"})
+
+validate_body = compile_schema({
+    "site": {"type": str, "required": True, "max_length": 2048},
+    "user_id": {"type": str, "max_length": 128},
+    "subdirectory": {"type": str, "max_length": 256},
+}, max_body_length=8 * 1024)
 
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded = verify_token(token)
+        decoded = get_claims(event)
         user_id = decoded["sub"]
 
-        body = parse_body(event.get("body"))
+        body = parse_body(event.get("body"), skip_fields=UNESCAPED_FIELDS, schema=validate_body)
         if not body or "site" not in body:
             return format_response(400, {"message": "Missing site parameter"})
 
@@ -43,21 +51,34 @@ def lambda_handler(event, context):
         if not matching_items:
             return format_response(404, {"message": "Password not found"})
 
+        writer = BatchWriter(dynamodb, f"{TABLE_PREFIX}passwords")
+        for item in matching_items:
+            writer.delete({"user_id": {"S": user_id}, "site": item["site"]})
+        writer.flush()
+        print(f"Deleted {len(matching_items)} rows, {writer.units} WCU")
+
+        # Everyone who could see a deleted secret gets a tombstone for it.
+        deleted = {}
         for item in matching_items:
-            print(f"Deleting item with site key: {item['site']['S']}")
-            dynamodb.delete_item(
-                TableName=f"{TABLE_PREFIX}passwords",
-                Key={
-                    "user_id": {"S": user_id},
-                    "site": {"S": item["site"]["S"]}
-                }
+            base_site = item["site"]["S"].rpartition("#")[0]
+            password_id = item.get("password_id", {}).get("S") or base_site.rpartition("#")[2]
+            users, groups = deleted.setdefault((password_id, base_site), (set(), set()))
+            users.add(item.get("shared_with_users", {}).get("S", "NONE"))
+            groups.add(item.get("shared_with_groups", {}).get("S", "NONE"))
+        for (password_id, base_site), (users, groups) in deleted.items():
+            record_changes(
+                dynamodb, CHANGES_TABLE, user_id, password_id, base_site,
+                removed=change_audiences(user_id, users, groups),
             )
+        bump_group_revisions(dynamodb, REVISIONS_TABLE, set().union(*(groups for _, groups in deleted.values())))
 
         return format_response(200, {
             "message": "Password deleted successfully",
             "count": len(matching_items)
         })
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as e:
         print("Error deleting password:", e)
         message = str(e)
@@ -1,22 +1,115 @@
 import os
-import json
-import boto3
-from jwtlib import verify_token, format_response, parse_body, get_auth_token
+from jwtlib import get_claims, format_response, parse_body, codec, LazyClient, BatchWriter, WriteConflict, ValidationError, compile_schema, SHARED_WITH_SPEC, change_audiences, record_changes, bump_group_revisions, share_attributes, existing_shares
 from datetime import datetime, timezone
 
-dynamodb = boto3.client("dynamodb")
+dynamodb = LazyClient("dynamodb")
 TABLE_PREFIX = os.environ.get("TABLE_PREFIX", "RunaVault_")
+PASSWORDS_TABLE = f"{TABLE_PREFIX}passwords"
+CHANGES_TABLE = f"{TABLE_PREFIX}changes"
+REVISIONS_TABLE = f"{TABLE_PREFIX}revisions"
 MAX_NOTES_LENGTH = 500
 
+# The password is ciphertext and the user_id and sharedWith IDs are key
+# parts, so parse_body leaves them as sent.
+UNESCAPED_FIELDS = frozenset({"password", "sharedWith", "user_id"})
+
+validate_body = compile_schema({
+    "site": {"type": str, "required": True, "max_length": 2048},
+    "user_id": {"type": str, "max_length": 128},
+    "username": {"type": str, "max_length": 512},
+    "password": {"type": str},
+    "encrypted": {"type": bool},
+    "sharedWith": SHARED_WITH_SPEC,
+    "subdirectory": {"type": str, "max_length": 256},
+    "notes": {"type": str, "max_length": MAX_NOTES_LENGTH},
+    "tags": {"type": list, "max_items": 50, "items": {"type": str, "max_length": 64}},
+    "favorite": {"type": bool},
+    "version": {"type": int},
+}, max_body_length=256 * 1024)
+# Rows for shares added by an edit must not exist yet.
+NEW_ROW = {"ConditionExpression": "attribute_not_exists(site)"}
+# Attributes an edit may change without rewriting the secret's rows.
+METADATA_ATTRIBUTES = frozenset({"username", "notes", "tags", "favorite", "encrypted"})
+# What an edit writes for attributes older rows lack, so that filling them
+# in does not count as a change.
+ROW_DEFAULTS = {"shared_with_roles": {"M": {}}, "subdirectory": {"S": "default"}}
+
+
+def secret_rows(user_id, site):
+    params = {
+        "TableName": PASSWORDS_TABLE,
+        "KeyConditionExpression": "user_id = :user_id AND begins_with(site, :site)",
+        "ExpressionAttributeValues": {
+            ":user_id": {"S": user_id},
+            ":site": {"S": site}
+        }
+    }
+    items = []
+    while True:
+        response = dynamodb.query(**params)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return items
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def row_version(item):
+    return int(item.get("version", {}).get("N", "0"))
+
+
+def unchanged(item):
+    """Condition that ``item`` still holds the version it was read with."""
+    if "version" not in item:
+        return {"ConditionExpression": "attribute_exists(site) AND attribute_not_exists(version)"}
+    return {
+        "ConditionExpression": "#version = :version",
+        "ExpressionAttributeNames": {"#version": "version"},
+        "ExpressionAttributeValues": {":version": item["version"]},
+    }
+
+
+def metadata_changes(items, put_items):
+    """The attributes an edit changes, as {name: value}, if it can update
+    the existing rows in place: the same rows, all at one version, and
+    nothing but METADATA_ATTRIBUTES differs. None if the rows have to be
+    rewritten."""
+    existing = {item["site"]["S"]: item for item in items}
+    if set(existing) != {item["site"]["S"] for item in put_items}:
+        return None
+    if len({row_version(item) for item in items}) != 1:
+        return None
+    changes = {}
+    for item in put_items:
+        old = existing[item["site"]["S"]]
+        for name, value in item.items():
+            if name not in ("last_modified", "version") and old.get(name, ROW_DEFAULTS.get(name)) != value:
+                if name not in METADATA_ATTRIBUTES:
+                    return None
+                changes[name] = value
+    return changes
+
+
+def conflict(current_version, partial=False):
+    if partial:
+        # Only secrets with more than 100 rows are rewritten in several
+        # transactions, and only those can be left half edited.
+        return format_response(409, {
+            "message": "Conflict: the secret was changed by another request while this edit was being saved, "
+                       "so only part of it was saved; reload it and try again",
+            "current_version": current_version,
+            "partial": True,
+        })
+    return format_response(409, {
+        "message": "Conflict: the secret was changed by another request, reload it and try again",
+        "current_version": current_version,
+    })
+
+
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded = verify_token(token)
+        decoded = get_claims(event)
         user_id_from_token = decoded["sub"]
-        body = parse_body(event.get("body", {}))
-
-        if "site" not in body:
-            return format_response(400, {"message": "Missing site parameter"})
+        body = parse_body(event.get("body", {}), skip_fields=UNESCAPED_FIELDS, schema=validate_body)
 
         site = body["site"]
         user_id = body.get("user_id", user_id_from_token)
@@ -28,29 +121,32 @@ def lambda_handler(event, context):
         shared_with = body.get("sharedWith")
         notes = body.get("notes")
         tags = body.get("tags")
+        expected_version = body.get("version")
 
         if "#" not in site:
             return format_response(400, {
                 "message": "Invalid site format: Must include password_id (e.g., 'baseSite#password_id')"
             })
 
-        if notes and len(notes) > MAX_NOTES_LENGTH:
-            return format_response(400, {
-                "message": f"Notes cannot exceed {MAX_NOTES_LENGTH} characters"
-            })
+        if password:
+            # Passwords are stored as JSON objects, which list_secrets passes
+            # through without decoding; a bare ciphertext is wrapped the way
+            # create_secret wraps it.
+            try:
+                password_data = codec.loads(password) if password.startswith("{") else {
+                    "encryptedPassword": password,
+                    "sharedWith": {"users": [], "groups": []}
+                }
+            except codec.JSONDecodeError:
+                password_data = None
+            if not isinstance(password_data, dict):
+                return format_response(400, {"message": "Invalid password format"})
+            if not password.startswith("{"):
+                password = codec.dumps(password_data)
 
         user_groups = decoded.get("cognito:groups", [])
 
-        query_response = dynamodb.query(
-            TableName=f"{TABLE_PREFIX}passwords",
-            KeyConditionExpression="user_id = :user_id AND begins_with(site, :site)",
-            ExpressionAttributeValues={
-                ":user_id": {"S": user_id},
-                ":site": {"S": site}
-            }
-        )
-
-        items = query_response.get("Items", [])
+        items = secret_rows(user_id, site)
         if not items:
             return format_response(404, {"message": "Password not found"})
 
@@ -72,9 +168,10 @@ def lambda_handler(event, context):
                     "message": "Permission denied: You can only edit your own secrets or those where you're an editor"
                 })
 
+        existing_users, existing_groups = existing_shares(items)
         existing_shared_with = {
-            "users": [item["shared_with_users"]["S"] for item in items if item.get("shared_with_users", {}).get("S") != "NONE"],
-            "groups": [item["shared_with_groups"]["S"] for item in items if item.get("shared_with_groups", {}).get("S") != "NONE"],
+            "users": existing_users,
+            "groups": existing_groups,
             "roles": {k: v["S"] for k, v in existing_item.get("shared_with_roles", {}).get("M", {}).items()} if "shared_with_roles" in existing_item else {},
         }
 
@@ -84,9 +181,16 @@ def lambda_handler(event, context):
             "roles": shared_with.get("roles", existing_shared_with["roles"]) if shared_with else existing_shared_with["roles"],
         }
 
+        # Clients that send the version they edited get a conflict if the
+        # secret has moved on since; the write below is conditioned on the
+        # version read here either way.
+        current_version = row_version(existing_item)
+        if expected_version is not None and expected_version != current_version:
+            return conflict(current_version)
+
         last_modified = datetime.now(timezone.utc).isoformat()
 
-        version = str(int(existing_item.get("version", {}).get("N", "0")) + 1)
+        version = str(current_version + 1)
 
         base_item = {
             "user_id": {"S": user_id},
@@ -105,50 +209,65 @@ def lambda_handler(event, context):
             "password_id": {"S": existing_item.get("password_id", {}).get("S", site.split("#")[2] if len(site.split("#")) > 2 else "")}
         }
 
-        # Delete existing items
-        for item in items:
-            dynamodb.delete_item(
-                TableName=f"{TABLE_PREFIX}passwords",
-                Key={
-                    "user_id": {"S": user_id},
-                    "site": {"S": item["site"]["S"]}
-                }
-            )
-
-        # Write updated items
-        put_items = []
         users = updated_shared_with["users"] or ["NONE"]
         groups = updated_shared_with["groups"] or ["NONE"]
+        put_items = [
+            {**base_item, "site": {"S": f"{site}#group:{group}"}, **share_attributes(group=group)}
+            for group in groups
+        ] + [
+            {**base_item, "site": {"S": f"{site}#user:{shared_user}"}, **share_attributes(user=shared_user)}
+            for shared_user in users
+        ]
 
-        for group in groups:
-            composite_site = f"{site}#group:{group}"
-            item = {
-                **base_item,
-                "site": {"S": composite_site},
-                "shared_with_groups": {"S": group},
-                "shared_with_users": {"S": "NONE"}
-            }
-            put_items.append(item)
-
-        for shared_user in users:
-            composite_site = f"{site}#user:{shared_user}"
-            item = {
-                **base_item,
-                "site": {"S": composite_site},
-                "shared_with_groups": {"S": "NONE"},
-                "shared_with_users": {"S": shared_user}
-            }
-            put_items.append(item)
+        changes = metadata_changes(items, put_items)
+        try:
+            if changes:
+                # Metadata-only edit: the rows stay and only the changed
+                # attributes, version and last_modified are set on them, in
+                # one transaction on the same version condition. An update
+                # costs half the writes of a delete and a put.
+                values = {**changes, "last_modified": base_item["last_modified"], "version": base_item["version"]}
+                writer = BatchWriter(dynamodb, PASSWORDS_TABLE)
+                for item in items:
+                    writer.update({"user_id": item["user_id"], "site": item["site"]}, values, condition=unchanged(item))
+                writer.flush()
+                print(f"Updated {len(items)} rows of {site} in place ({', '.join(sorted(changes))}), {writer.units} WCU")
+            elif changes is None:
+                # Replace the rows in one transaction. Every existing row is
+                # only deleted or overwritten if it still carries the version
+                # read above, so a concurrent edit makes this one fail with a
+                # conflict instead of mixing the two. Wide shares need one
+                # transaction per 100 rows, and a conflict in a later one
+                # leaves the earlier ones applied (see conflict()).
+                writer = BatchWriter(dynamodb, PASSWORDS_TABLE)
+                existing = {}
+                for item in items:
+                    existing[item["site"]["S"]] = item
+                    writer.delete({"user_id": {"S": user_id}, "site": item["site"]}, condition=unchanged(item))
+                for item in put_items:
+                    old = existing.get(item["site"]["S"])
+                    writer.put(item, condition=unchanged(old) if old else NEW_ROW)
+                writer.flush()
+                print(f"Rewrote {len(put_items)} rows of {site}, {writer.units} WCU")
+            else:
+                # Nothing changed, so nothing is written.
+                last_modified = existing_item.get("last_modified", {}).get("S", last_modified)
+                base_item["version"] = {"N": str(current_version)}
+        except WriteConflict as e:
+            print(f"Edit of {site} conflicted with a concurrent write")
+            versions = [row_version(item) for item in e.items] or [row_version(item) for item in secret_rows(user_id, site)]
+            if not versions:
+                return format_response(404, {"message": "Password not found"})
+            return conflict(max(versions), partial=e.committed > 0)
 
-        for item in put_items:
-            try:
-                dynamodb.put_item(
-                    TableName=f"{TABLE_PREFIX}passwords",
-                    Item=item,
-                    ConditionExpression="attribute_not_exists(user_id) AND attribute_not_exists(site)"
-                )
-            except dynamodb.exceptions.ConditionalCheckFailedException:
-                raise Exception(f"An item already exists for {item['site']['S']}")
+        if changes != {}:
+            # Users and groups dropped from the share get a tombstone.
+            record_changes(
+                dynamodb, CHANGES_TABLE, user_id, base_item["password_id"]["S"], site,
+                upserted=change_audiences(user_id, users, groups),
+                removed=change_audiences(user_id, existing_shared_with["users"], existing_shared_with["groups"]),
+            )
+            bump_group_revisions(dynamodb, REVISIONS_TABLE, set(groups) | set(existing_shared_with["groups"]))
 
         return format_response(200, {
             "message": "Password updated successfully and moved to new subdirectory" if is_subdirectory_changed else "Password updated successfully",
@@ -172,6 +291,8 @@ def lambda_handler(event, context):
             }
         })
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as e:
         print(f"Error updating secret: {e}")
         message = str(e)
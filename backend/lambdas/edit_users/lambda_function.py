@@ -1,7 +1,6 @@
 import os
-import boto3
 import logging
-from jwtlib import get_auth_token, verify_token, parse_body, format_response
+from jwtlib import get_claims, parse_body, format_response, LazyClient, ValidationError, compile_schema
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,21 +8,30 @@ logger.setLevel(logging.INFO)
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 AWS_REGION = os.environ.get("AWS_REGION")
 
-cognito = boto3.client("cognito-idp", region_name=AWS_REGION)
+cognito = LazyClient("cognito-idp", region_name=AWS_REGION)
+
+validate_body = compile_schema({
+    "username": {"type": str, "required": True, "max_length": 254},
+    "deleteUser": {"type": bool},
+    "editUser": {"type": bool},
+    "newUsername": {"type": str, "max_length": 254},
+    "given_name": {"type": str, "max_length": 128},
+    "family_name": {"type": str, "max_length": 128},
+    "password": {"type": str, "max_length": 256},
+}, max_body_length=4 * 1024)
 
 def lambda_handler(event, context):
     try:
         logger.info("User admin operation started")
 
-        token = get_auth_token(event)
-        decoded_token = verify_token(token)
+        decoded_token = get_claims(event)
         user_groups = decoded_token.get("cognito:groups", [])
 
         if "Admin" not in user_groups:
             logger.warning("User is not in Admin group")
             return format_response(403, {"message": "Forbidden: Only Admin users can perform this action"})
 
-        body = parse_body(event.get("body", "{}"))
+        body = parse_body(event.get("body", "{}"), schema=validate_body)
         username = body.get("username")
         delete_user = body.get("deleteUser")
         edit_user = body.get("editUser")
@@ -71,6 +79,8 @@ def lambda_handler(event, context):
 
         return format_response(400, {"message": "No valid action specified (delete or edit)"})
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as e:
         logger.exception("Error during user management")
         status_code = 401 if "Unauthorized" in str(e) else 500
@@ -0,0 +1,124 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from jwtlib import get_claims, format_response, parse_body, LazyClient, ValidationError, compile_schema
+from jwtlib.batch import batch_get, BATCH_GET_SIZE
+from jwtlib.lookup import share_rows, authorize, secret_body
+
+TABLE_PREFIX = os.environ.get('TABLE_PREFIX', 'RunaVault_')
+PASSWORDS_TABLE = f"{TABLE_PREFIX}passwords"
+# password_id and user_id are looked up exactly as stored.
+UNESCAPED_FIELDS = frozenset({'password_id', 'user_id'})
+MAX_BATCH_SECRETS = int(os.environ.get('MAX_BATCH_SECRETS', '100'))
+
+# Each requested secret needs one password_id-index query, then the
+# authorized rows are read with BatchGetItem, 100 keys per request. Both
+# steps run on a pool that lives for the life of the container, with the
+# DynamoDB client's connection pool sized to match it.
+LOOKUP_CONCURRENCY = int(os.environ.get('LOOKUP_CONCURRENCY', '8'))
+lookup_executor = ThreadPoolExecutor(max_workers=LOOKUP_CONCURRENCY, thread_name_prefix='lookup')
+dynamodb = LazyClient('dynamodb', max_pool_connections=LOOKUP_CONCURRENCY)
+
+validate_body = compile_schema({
+    'secrets': {
+        'type': list,
+        'required': True,
+        'max_items': MAX_BATCH_SECRETS,
+        'items': {
+            'type': dict,
+            'fields': {
+                'password_id': {'type': str, 'required': True, 'max_length': 64},
+                'user_id': {'type': str, 'max_length': 128},
+            },
+        },
+    },
+}, max_body_length=64 * 1024)
+
+
+def error(request, status, message):
+    return {**request, 'status': status, 'message': message}
+
+
+def resolve(request, user_id, user_groups):
+    """The row that grants the caller access to one requested secret, as
+    (row, group), or (None, None)."""
+    rows = share_rows(dynamodb, PASSWORDS_TABLE, request['password_id'], request.get('user_id'))
+    return authorize(rows, request['password_id'], user_id, user_groups)
+
+
+def fetch_rows(keys):
+    """Read rows by key, ``{(user_id, site): item}``, plus the keys of
+    chunks that could not be read."""
+    chunks = [keys[start:start + BATCH_GET_SIZE] for start in range(0, len(keys), BATCH_GET_SIZE)]
+    futures = [lookup_executor.submit(batch_get, dynamodb, PASSWORDS_TABLE, chunk) for chunk in chunks]
+    items, failed = {}, set()
+    for chunk, future in zip(chunks, futures):
+        try:
+            for item in future.result():
+                items[(item['user_id']['S'], item['site']['S'])] = item
+        except Exception as e:
+            print(f"Error reading {len(chunk)} secrets: {e}")
+            failed.update((key['user_id']['S'], key['site']['S']) for key in chunk)
+    return items, failed
+
+
+def lambda_handler(event, context):
+    try:
+        user_claims = get_claims(event)
+        if not user_claims.get('sub'):
+            return format_response(403, {'message': 'Forbidden - Invalid Token'})
+
+        user_id = user_claims['sub']
+        user_groups = user_claims.get('cognito:groups', [])
+        body = parse_body(event.get('body'), skip_fields=UNESCAPED_FIELDS, schema=validate_body)
+        requests = [
+            {'password_id': r['password_id'], **({'user_id': r['user_id']} if r.get('user_id') else {})}
+            for r in body['secrets']
+        ]
+
+        # Resolve every secret to the row that grants access, then read all
+        # of those rows in as few BatchGetItem requests as possible.
+        futures = [lookup_executor.submit(resolve, request, user_id, user_groups) for request in requests]
+        grants = []
+        for request, future in zip(requests, futures):
+            try:
+                grants.append(future.result())
+            except Exception as e:
+                print(f"Error resolving {request['password_id']}: {e}")
+                grants.append(e)
+        keys = {}
+        for grant in grants:
+            if isinstance(grant, tuple) and grant[0] is not None:
+                row = grant[0]
+                keys[(row['user_id']['S'], row['site']['S'])] = {'user_id': row['user_id'], 'site': row['site']}
+        items, failed = fetch_rows(list(keys.values()))
+
+        results = []
+        for request, grant in zip(requests, grants):
+            if isinstance(grant, Exception):
+                results.append(error(request, 500, 'Internal Server Error'))
+                continue
+            row, group = grant
+            if row is None:
+                results.append(error(request, 404, 'Password not found'))
+                continue
+            key = (row['user_id']['S'], row['site']['S'])
+            if key in failed:
+                results.append(error(request, 503, 'Secret could not be read, try again'))
+                continue
+            item = items.get(key)
+            secret = secret_body(item, row['site']['S'].rpartition('#')[0], group) if item else None
+            if item is None:
+                results.append(error(request, 404, 'Password not found'))
+            elif secret is None:
+                results.append(error(request, 500, 'Secret data is incomplete in the database'))
+            else:
+                results.append({**secret, 'status': 200})
+
+        print(f"Returning {sum(r['status'] == 200 for r in results)} of {len(results)} requested secrets")
+        return format_response(200, {'secrets': results})
+    except ValidationError as e:
+        return format_response(400, {'message': str(e)})
+    except Exception as e:
+        print(f"Error: {e}")
+        status_code = 401 if 'Unauthorized' in str(e) else 403 if 'Forbidden' in str(e) else 500
+        return format_response(status_code, {'message': str(e) or 'Internal Server Error'})
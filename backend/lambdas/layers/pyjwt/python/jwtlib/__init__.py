@@ -1,8 +1,21 @@
 from .utils import (
     verify_token,
+    claims_cache_stats,
+    get_claims,
+    normalize_groups,
     format_response,
+    format_cacheable_response,
     get_auth_token,
+    get_header,
     sanitize_string,
     sanitize_object,
     parse_body,
 )
+from .aws import get_client, LazyClient
+from .codec import RawJSON
+from .batch import BatchWriter, WriteConflict
+from .schema import ValidationError, compile_schema, SHARED_WITH_SPEC
+from .changes import change_audiences, record_changes
+from .access import publish_membership_change
+from .revisions import bump_group_revisions
+from .shares import share_attributes, row_share, existing_shares
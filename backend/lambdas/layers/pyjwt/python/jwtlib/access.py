@@ -0,0 +1,34 @@
+import os
+
+from . import codec
+from .aws import get_client
+
+# Name of the access-view processor; membership changes are only published
+# when the stack deploys it.
+ACCESS_VIEW_FUNCTION = os.environ.get("ACCESS_VIEW_FUNCTION", "")
+
+
+def publish_membership_change(usernames, added=(), removed=()):
+    """Tell the access-view processor that users joined or left groups.
+
+    The event is delivered with an asynchronous invoke, so admin requests
+    do not wait for the view to be updated. A failure is logged: Cognito
+    already holds the new membership and the view can be rebuilt with
+    backend/scripts/backfill_access_view.py.
+    """
+    if not ACCESS_VIEW_FUNCTION or not usernames or not (added or removed):
+        return
+    payload = {
+        "type": "membership",
+        "usernames": list(usernames),
+        "added": list(added),
+        "removed": list(removed),
+    }
+    try:
+        get_client("lambda").invoke(
+            FunctionName=ACCESS_VIEW_FUNCTION,
+            InvocationType="Event",
+            Payload=codec.dumps(payload).encode("utf-8"),
+        )
+    except Exception as e:
+        print(f"Failed to publish membership change: {e}")
@@ -0,0 +1,47 @@
+import threading
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name, max_pool_connections=None, **kwargs):
+    """Return a boto3 client, importing boto3 and building it on first use.
+
+    ``max_pool_connections`` sizes the client's urllib3 connection pool,
+    which needs to be at least as large as the number of threads sharing
+    the client. Client construction is serialized because boto3's default
+    session is not thread-safe.
+    """
+    key = (service_name, max_pool_connections, tuple(sorted(kwargs.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                import boto3
+
+                if max_pool_connections is not None:
+                    from botocore.config import Config
+
+                    kwargs["config"] = Config(max_pool_connections=max_pool_connections)
+                client = _clients[key] = boto3.client(service_name, **kwargs)
+    return client
+
+
+class LazyClient:
+    """Module-level stand-in for a boto3 client.
+
+    Handlers keep the familiar ``dynamodb = ...`` global, but boto3 is only
+    imported and the client only constructed when a request actually calls
+    AWS, so requests rejected before that never pay for it.
+    """
+
+    def __init__(self, service_name, **kwargs):
+        self._service_name = service_name
+        self._kwargs = kwargs
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            self._client = get_client(self._service_name, **self._kwargs)
+        return getattr(self._client, name)
@@ -0,0 +1,198 @@
+import random
+import time
+
+from . import codec
+
+BATCH_WRITE_SIZE = 25
+BATCH_WRITE_ATTEMPTS = 5
+TRANSACT_WRITE_SIZE = 100
+# TransactWriteItems also caps a request at 4 MB; the JSON size of the
+# requests is a safe overestimate of what DynamoDB counts.
+TRANSACT_WRITE_BYTES = 4 * 1000 * 1000
+TRANSACT_WRITE_ATTEMPTS = 5
+# Transaction cancellation reasons that clear up on their own. Requests
+# that did not cause the cancellation report "None".
+RETRYABLE_CANCELLATIONS = frozenset({"None", "TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded"})
+
+
+def consumed_units(response):
+    """Capacity units reported by a response made with
+    ReturnConsumedCapacity="TOTAL"."""
+    return sum(c.get("CapacityUnits", 0) for c in response.get("ConsumedCapacity") or [])
+
+
+def batch_write(client, table_name, requests):
+    """Send Put/DeleteRequests with BatchWriteItem, 25 at a time.
+
+    Unprocessed items are retried with jittered exponential backoff; an
+    Exception is raised if some are still left after BATCH_WRITE_ATTEMPTS.
+    Returns the write units consumed.
+    """
+    units = 0
+    for start in range(0, len(requests), BATCH_WRITE_SIZE):
+        pending = {table_name: requests[start:start + BATCH_WRITE_SIZE]}
+        for attempt in range(BATCH_WRITE_ATTEMPTS):
+            response = client.batch_write_item(RequestItems=pending, ReturnConsumedCapacity="TOTAL")
+            units += consumed_units(response)
+            pending = response.get("UnprocessedItems") or {}
+            if not pending:
+                break
+            time.sleep(random.uniform(0, min(0.05 * 2 ** attempt, 1.0)))
+        else:
+            raise Exception(f"{len(pending.get(table_name, []))} batch write requests left unprocessed")
+    return units
+
+
+class WriteConflict(Exception):
+    """A conditional write was rejected. ``items`` holds the stored version
+    of each item whose condition failed, where there was one, and
+    ``committed`` the number of earlier transactions of the same flush
+    that were already applied."""
+
+    def __init__(self, items, committed=0):
+        super().__init__("Conflict: the item was changed by another request")
+        self.items = items
+        self.committed = committed
+
+
+class BatchWriter:
+    """Buffer puts, updates and deletes on one table and write them in bulk.
+
+    Requests are keyed by the table's key attributes, so a later put or
+    delete of the same item replaces an earlier one (a delete followed by
+    a put becomes a plain put). ``flush`` sends the buffer with
+    BatchWriteItem, 25 requests per call, unless a request is an update or
+    carries a condition; then the whole buffer goes through
+    TransactWriteItems, up to 100 requests and 4 MB per transaction, in
+    the order queued, and a failed condition raises WriteConflict. Each
+    transaction is atomic, a flush that needs several is not: the
+    transactions sent before the one that failed stay applied.
+    ``units`` totals the write units consumed by every flush.
+    """
+
+    def __init__(self, client, table_name, key_names=("user_id", "site")):
+        self.client = client
+        self.table_name = table_name
+        self.key_names = key_names
+        self.requests = {}
+        self.units = 0
+
+    def __len__(self):
+        return len(self.requests)
+
+    def _key(self, item):
+        return tuple(item[name]["S"] for name in self.key_names)
+
+    def put(self, item, condition=None):
+        """Queue a put. ``condition`` holds ConditionExpression and its
+        expression attribute names and values."""
+        self.requests[self._key(item)] = ("Put", {"Item": item}, condition)
+
+    def update(self, key, values, condition=None):
+        """Queue an update that SETs ``values``, {name: attribute value}."""
+        self.requests[self._key(key)] = ("Update", {
+            "Key": key,
+            "UpdateExpression": "SET " + ", ".join(f"#{name} = :new_{name}" for name in values),
+            "ExpressionAttributeNames": {f"#{name}": name for name in values},
+            "ExpressionAttributeValues": {f":new_{name}": value for name, value in values.items()},
+        }, condition)
+
+    def delete(self, key, condition=None):
+        self.requests[self._key(key)] = ("Delete", {"Key": key}, condition)
+
+    def flush(self):
+        """Write the buffer and clear it. Returns the write units consumed."""
+        requests, self.requests = list(self.requests.values()), {}
+        if any(condition or kind == "Update" for kind, _, condition in requests):
+            units = 0
+            for committed, chunk in enumerate(self._transactions(requests)):
+                try:
+                    units += self._transact(chunk)
+                except WriteConflict as e:
+                    self.units += units
+                    e.committed = committed
+                    raise
+        else:
+            units = batch_write(self.client, self.table_name, [
+                {"PutRequest": request} if kind == "Put" else {"DeleteRequest": request}
+                for kind, request, _ in requests
+            ])
+        self.units += units
+        return units
+
+    def _transactions(self, requests):
+        chunk, size = [], 0
+        for request in requests:
+            request_size = len(codec.dumps(request))
+            if chunk and (len(chunk) == TRANSACT_WRITE_SIZE or size + request_size > TRANSACT_WRITE_BYTES):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(request)
+            size += request_size
+        if chunk:
+            yield chunk
+
+    def _transact(self, requests):
+        items = []
+        for kind, request, condition in requests:
+            operation = {"TableName": self.table_name, **request}
+            if condition:
+                # An update's own names and values are merged with the
+                # condition's rather than replaced by them.
+                for name, value in condition.items():
+                    operation[name] = {**operation[name], **value} if isinstance(value, dict) and name in operation else value
+                operation["ReturnValuesOnConditionCheckFailure"] = "ALL_OLD"
+            items.append({kind: operation})
+        for attempt in range(TRANSACT_WRITE_ATTEMPTS):
+            try:
+                response = self.client.transact_write_items(TransactItems=items, ReturnConsumedCapacity="TOTAL")
+                return consumed_units(response)
+            except Exception as e:
+                error = getattr(e, "response", {})
+                if error.get("Error", {}).get("Code") != "TransactionCanceledException":
+                    raise
+                reasons = error.get("CancellationReasons") or []
+                if any(r.get("Code") == "ConditionalCheckFailed" for r in reasons):
+                    raise WriteConflict([
+                        r["Item"] for r in reasons
+                        if r.get("Code") == "ConditionalCheckFailed" and r.get("Item")
+                    ])
+                if attempt == TRANSACT_WRITE_ATTEMPTS - 1 or not all(
+                    r.get("Code") in RETRYABLE_CANCELLATIONS for r in reasons
+                ):
+                    raise
+            time.sleep(random.uniform(0, min(0.05 * 2 ** attempt, 1.0)))
+
+BATCH_GET_SIZE = 100
+BATCH_GET_ATTEMPTS = 5
+
+
+def batch_get(client, table_name, keys, executor=None, projection=None):
+    """Read items by key with BatchGetItem, 100 at a time.
+
+    Unprocessed keys are retried like batch_write. With an ``executor`` the
+    chunks are requested concurrently. Items come back in no particular
+    order and missing keys are simply absent.
+    """
+    chunks = [keys[start:start + BATCH_GET_SIZE] for start in range(0, len(keys), BATCH_GET_SIZE)]
+    if executor is None or len(chunks) < 2:
+        results = [_batch_get_chunk(client, table_name, chunk, projection) for chunk in chunks]
+    else:
+        results = executor.map(lambda chunk: _batch_get_chunk(client, table_name, chunk, projection), chunks)
+    return [item for items in results for item in items]
+
+
+def _batch_get_chunk(client, table_name, keys, projection):
+    request = {"Keys": keys}
+    if projection:
+        request.update(projection)
+    pending = {table_name: request}
+    items = []
+    for attempt in range(BATCH_GET_ATTEMPTS):
+        response = client.batch_get_item(RequestItems=pending)
+        items.extend(response.get("Responses", {}).get(table_name, []))
+        pending = response.get("UnprocessedKeys") or {}
+        if not pending:
+            return items
+        time.sleep(random.uniform(0, min(0.05 * 2 ** attempt, 1.0)))
+    raise Exception(f"{len(pending[table_name]['Keys'])} batch get keys left unprocessed")
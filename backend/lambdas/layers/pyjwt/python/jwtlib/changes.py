@@ -0,0 +1,71 @@
+import os
+import time
+
+from .batch import batch_write
+
+# Change-log entries expire through the table's TTL after this long; clients
+# whose watermark is older have to do a full listing again.
+CHANGE_RETENTION_SECONDS = int(os.environ.get("CHANGE_RETENTION_DAYS", "30")) * 86400
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def change_audiences(owner, users=(), groups=()):
+    """Return the change-log partitions for a secret's owner and shares.
+
+    ``owner:{sub}`` holds changes to a user's own secrets, ``group:{name}``
+    and ``user:{sub}`` changes to secrets shared with them. "NONE"
+    placeholders are ignored.
+    """
+    audiences = {f"owner:{owner}"}
+    audiences.update(f"group:{group}" for group in groups if group and group != "NONE")
+    audiences.update(f"user:{user}" for user in users if user and user != "NONE")
+    return audiences
+
+
+def change_key(modified_ms, owner, password_id):
+    """Sort key of a change entry. The zero-padded timestamp makes range
+    queries on modification time a plain string comparison."""
+    return f"{modified_ms:013d}#{owner}#{password_id}"
+
+
+def record_changes(client, table_name, owner, password_id, site, upserted=(), removed=()):
+    """File a change entry for a secret under every affected audience.
+
+    ``upserted`` audiences can still see the secret after the write;
+    ``removed`` ones lost access to it and get a tombstone. Call this after
+    the secret's rows are written, so a reader that sees the entry also
+    sees the rows. A failure is logged rather than raised: the secret
+    itself was saved, and clients fall back to a full listing once their
+    watermark expires.
+    """
+    modified_ms = now_ms()
+    expires_at = modified_ms // 1000 + CHANGE_RETENTION_SECONDS
+    removed = set(removed) - set(upserted)
+    requests = [
+        {
+            "PutRequest": {
+                "Item": {
+                    "audience": {"S": audience},
+                    "change_key": {"S": change_key(modified_ms, owner, password_id)},
+                    "owner": {"S": owner},
+                    "password_id": {"S": password_id},
+                    "site": {"S": site},
+                    "op": {"S": op},
+                    "modified_at": {"N": str(modified_ms)},
+                    "expires_at": {"N": str(expires_at)},
+                }
+            }
+        }
+        for op, audiences in (("upsert", upserted), ("delete", removed))
+        for audience in sorted(audiences)
+    ]
+    try:
+        batch_write(client, table_name, requests)
+    except Exception as e:
+        print(f"Failed to record changes for {owner}/{password_id}: {e}")
+        return False
+    return True
+
@@ -0,0 +1,64 @@
+import json
+import re
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError subclasses this, so callers can catch one type.
+JSONDecodeError = json.JSONDecodeError
+
+_ORJSON_FRAGMENT = getattr(orjson, "Fragment", None)
+
+
+class RawJSON:
+    """Already-serialized JSON that dumps() embeds verbatim.
+
+    Used for values stored as JSON strings (such as the encrypted password
+    payload) so they are not decoded only to be encoded again.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Serialize ``obj`` to a JSON string, using orjson when it is installed."""
+    if _ORJSON_FRAGMENT is not None:
+        return orjson.dumps(obj, default=_to_fragment, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    # Without native fragment support each RawJSON is serialized as a unique
+    # placeholder string which is swapped for the raw value in one pass.
+    fragments = []
+    marker = uuid.uuid4().hex
+
+    def default(value):
+        if isinstance(value, RawJSON):
+            fragments.append(value.value)
+            return f"{marker}:{len(fragments) - 1}"
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    if orjson is not None:
+        text = orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    else:
+        text = json.dumps(obj, default=default)
+
+    if not fragments:
+        return text
+    return re.sub(f'"{marker}:(\\d+)"', lambda match: fragments[int(match.group(1))], text)
+
+
+def _to_fragment(value):
+    if isinstance(value, RawJSON):
+        return _ORJSON_FRAGMENT(value.value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+
+class JWKSCache:
+    """Lazily loaded Cognito signing keys, indexed by kid.
+
+    Keys are fetched on first use rather than at import time, kept as
+    constructed public-key objects and reloaded once ``ttl`` seconds have
+    passed. An unknown kid (key rotation) triggers one extra fetch. Both
+    kinds of refetch happen at most once every ``min_refresh_interval``
+    seconds, and a failed refetch keeps the stale keys in use, so an
+    unreachable endpoint does not add ``timeout`` to every request.
+    """
+
+    def __init__(self, url, ttl=3600, min_refresh_interval=60, timeout=3.0):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._loaded_at = None
+        self._last_fetch = None
+        self._lock = threading.Lock()
+
+    def get(self, kid):
+        now = time.monotonic()
+        stale = self._loaded_at is None or now - self._loaded_at >= self.ttl
+        if stale and (not self._keys or self._can_refetch(now)):
+            self._refresh(now)
+
+        key = self._keys.get(kid)
+        if key is None and self._can_refetch(now):
+            self._refresh(now)
+            key = self._keys.get(kid)
+
+        if key is None:
+            raise Exception("Public key not found in JWKS")
+        return key
+
+    def _can_refetch(self, now):
+        return self._last_fetch is None or now - self._last_fetch >= self.min_refresh_interval
+
+    def _refresh(self, now):
+        with self._lock:
+            if self._last_fetch is not None and self._last_fetch >= now:
+                # Another caller refreshed while we waited for the lock.
+                return
+            self._last_fetch = now
+            try:
+                keys = self._fetch()
+            except Exception as e:
+                if not self._keys:
+                    raise Exception(f"Unable to load JWKS: {str(e)}")
+                # Keep serving the keys we already have until Cognito answers again.
+                print(f"JWKS refresh failed, using cached keys: {e}")
+                return
+            self._keys = keys
+            self._loaded_at = now
+
+    def _fetch(self):
+        # Imported here so cold starts that never verify a token skip them.
+        import urllib.request
+        from jwt import PyJWK
+
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            document = json.load(response)
+        keys = {}
+        for key in document.get("keys", []):
+            if "kid" not in key:
+                continue
+            keys[key["kid"]] = PyJWK(key, algorithm=key.get("alg", "RS256")).key
+        return keys
@@ -0,0 +1,78 @@
+from . import codec
+from .shares import NONE
+
+# KEYS_ONLY index from a secret's password_id to its rows, sorted by owner.
+PASSWORD_ID_INDEX = "password_id-index"
+
+
+def share_rows(client, table_name, password_id, owner=None):
+    """Keys of every row of secret ``password_id``, limited to ``owner``'s
+    secret when the caller passes the owner hint."""
+    params = {
+        "TableName": table_name,
+        "IndexName": PASSWORD_ID_INDEX,
+        "KeyConditionExpression": "password_id = :password_id",
+        "ExpressionAttributeValues": {":password_id": {"S": password_id}},
+    }
+    if owner:
+        params["KeyConditionExpression"] += " AND user_id = :owner"
+        params["ExpressionAttributeValues"][":owner"] = {"S": owner}
+    rows = []
+    while True:
+        response = client.query(**params)
+        rows.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return rows
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def authorize(rows, password_id, user_id, user_groups):
+    """Pick the row that grants the caller access, as (row, group).
+
+    The share is read from the row's key, "{base}#{password_id}#group:{g}"
+    or "...#user:{sub}", so the index needs no other attributes. Owners
+    may use any row, others need a share with them or one of their groups.
+    ``group`` is set when access comes through a group share. Returns
+    (None, None) if no row grants access.
+    """
+    groups = set(user_groups) - {NONE}
+    user_row = group_row = None
+    for row in rows:
+        if row["user_id"]["S"] == user_id:
+            return row, None
+        kind, _, target = row["site"]["S"].partition(f"#{password_id}#")[2].partition(":")
+        if kind == "user" and target == user_id:
+            user_row = user_row or row
+        elif kind == "group" and target in groups and group_row is None:
+            group_row = (row, target)
+    if user_row:
+        return user_row, None
+    return group_row or (None, None)
+
+
+def group_password(password, group):
+    """The secret's password blob with the group's ciphertext on top."""
+    parsed_password_data = codec.loads(password)
+    group_encrypted_password = next((g.get("encryptedPassword") for g in parsed_password_data.get("sharedWith", {}).get("groups", []) if g.get("groupId") == group), None)
+    return codec.dumps({
+        "encryptedPassword": group_encrypted_password or parsed_password_data.get("encryptedPassword"),
+        "sharedWith": parsed_password_data.get("sharedWith", {})
+    })
+
+
+def secret_body(item, site, group=None):
+    """The get_secret response for a passwords row, or None if the row has
+    no password. ``group`` selects that group's ciphertext."""
+    encrypted_password_data = item.get("password", {}).get("S")
+    if not encrypted_password_data:
+        return None
+    if group:
+        encrypted_password_data = group_password(encrypted_password_data, group)
+    return {
+        "site": site,
+        "user_id": item["user_id"]["S"],
+        "password_id": item.get("password_id", {}).get("S"),
+        "username": item["username"]["S"],
+        "subdirectory": item.get("subdirectory", {}).get("S", "default"),
+        "password": encrypted_password_data
+    }
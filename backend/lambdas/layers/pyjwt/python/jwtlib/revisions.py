@@ -0,0 +1,57 @@
+from .batch import batch_get
+from .changes import now_ms
+
+# Each group's share rows have a revision counter, stored as
+# {"scope": "group:{name}", "revision": N, "bumped_at": epoch ms}. Writers
+# bump it after changing any row shared with the group; readers that cache
+# a group's rows reuse them only while the counter is unchanged. A group
+# that was never bumped is at revision 0.
+#
+# Readers query the group's rows on a GSI, which is eventually consistent:
+# right after a bump a query can still return the old rows. Caching those
+# under the new revision would serve them until the entry expires, so
+# readers do not cache a group for a short while after it was bumped.
+
+
+def group_scope(group):
+    return f"group:{group}"
+
+
+def bump_group_revisions(client, table_name, groups):
+    """Increment the revision of every group in ``groups``.
+
+    Call this after the rows are written, so a reader that sees the new
+    revision also sees the rows. "NONE" placeholders are ignored. A failure
+    is logged rather than raised: the rows themselves were saved, and
+    cached copies expire on their own.
+    """
+    ok = True
+    for group in sorted({group for group in groups if group and group != "NONE"}):
+        try:
+            client.update_item(
+                TableName=table_name,
+                Key={"scope": {"S": group_scope(group)}},
+                UpdateExpression="ADD revision :one SET bumped_at = :now",
+                ExpressionAttributeValues={":one": {"N": "1"}, ":now": {"N": str(now_ms())}},
+            )
+        except Exception as e:
+            print(f"Failed to bump revision of group {group}: {e}")
+            ok = False
+    return ok
+
+
+def read_group_revisions(client, table_name, groups, settle_ms=0):
+    """Return ``{group: revision}`` for ``groups`` using BatchGetItem.
+
+    Groups bumped less than ``settle_ms`` ago map to None, since the index
+    may not show their new rows yet.
+    """
+    groups = sorted(set(groups))
+    revisions = dict.fromkeys(groups, 0)
+    keys = [{"scope": {"S": group_scope(group)}} for group in groups]
+    settled_before = now_ms() - settle_ms
+    for item in batch_get(client, table_name, keys):
+        group = item["scope"]["S"].split(":", 1)[1]
+        bumped_at = int(item.get("bumped_at", {}).get("N", "0"))
+        revisions[group] = int(item["revision"]["N"]) if bumped_at <= settled_before else None
+    return revisions
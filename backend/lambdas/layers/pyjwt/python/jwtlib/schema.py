@@ -0,0 +1,159 @@
+import os
+
+MAX_SHARES = int(os.environ.get("MAX_SHARES", "100"))
+
+
+class ValidationError(Exception):
+    """A request body that does not match the route's schema (HTTP 400)."""
+
+
+def compile_schema(fields, max_body_length=None):
+    """Compile a declarative body schema into a validator function.
+
+    ``fields`` maps each top-level key to a spec dict that may contain:
+
+    - ``type``: a type or tuple of types (``bool`` never satisfies ``int``)
+    - ``required``: the key must be present and not null
+    - ``max_length``: maximum length of a string
+    - ``max_items``: maximum length of a list
+    - ``items``: spec applied to every list item
+    - ``fields``: nested schema for an object
+    - ``values``: spec applied to every value of an object
+    - ``choices``: allowed values
+
+    Schemas are compiled once at module load. The returned validator
+    raises ValidationError on the first mismatch and carries
+    ``max_body_length`` so parse_body can reject oversized bodies before
+    parsing them.
+    """
+    check_object = _compile_fields(fields, prefix="")
+
+    def validate(body):
+        if not isinstance(body, dict):
+            raise ValidationError("Invalid request: body must be a JSON object")
+        check_object(body)
+        return body
+
+    validate.max_body_length = max_body_length
+    return validate
+
+
+# The sharedWith object accepted by create_secret, edit_secret and
+# share_directory.
+SHARED_WITH_SPEC = {
+    "type": dict,
+    "fields": {
+        "users": {"type": list, "max_items": MAX_SHARES, "items": {"type": str, "max_length": 128}},
+        "groups": {"type": list, "max_items": MAX_SHARES, "items": {"type": str, "max_length": 128}},
+        "roles": {"type": dict, "values": {"type": str, "choices": ("viewer", "editor")}},
+    },
+}
+
+
+def _compile_fields(fields, prefix):
+    compiled = [
+        (key, spec.get("required", False), _compile_spec(spec, f"{prefix}{key}"))
+        for key, spec in fields.items()
+    ]
+
+    def check_fields(obj):
+        for key, required, check in compiled:
+            value = obj.get(key)
+            if value is None:
+                if required:
+                    raise ValidationError(f"Missing required parameter: {prefix}{key}")
+                continue
+            check(value)
+
+    return check_fields
+
+
+def _compile_spec(spec, path):
+    checks = []
+
+    expected = spec.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, tuple) else (expected,)
+        reject_bool = bool not in types and any(t in (int, float) for t in types)
+        type_names = " or ".join(_TYPE_NAMES.get(t, t.__name__) for t in types)
+
+        def check_type(value):
+            if not isinstance(value, types) or (reject_bool and isinstance(value, bool)):
+                raise ValidationError(f"Invalid request: {path} must be {type_names}")
+
+        checks.append(check_type)
+
+    if "max_length" in spec:
+        max_length = spec["max_length"]
+
+        def check_length(value):
+            if isinstance(value, str) and len(value) > max_length:
+                raise ValidationError(f"Invalid request: {path} cannot exceed {max_length} characters")
+
+        checks.append(check_length)
+
+    if "choices" in spec:
+        choices = frozenset(spec["choices"])
+
+        def check_choice(value):
+            if value not in choices:
+                raise ValidationError(f"Invalid request: {path} must be one of {', '.join(sorted(choices))}")
+
+        checks.append(check_choice)
+
+    if "max_items" in spec:
+        max_items = spec["max_items"]
+
+        def check_items_count(value):
+            if isinstance(value, list) and len(value) > max_items:
+                raise ValidationError(f"Invalid request: {path} cannot have more than {max_items} items")
+
+        checks.append(check_items_count)
+
+    if "items" in spec:
+        check_item = _compile_spec(spec["items"], f"{path}[]")
+
+        def check_items(value):
+            if isinstance(value, list):
+                for item in value:
+                    check_item(item)
+
+        checks.append(check_items)
+
+    if "fields" in spec:
+        check_nested = _compile_fields(spec["fields"], prefix=f"{path}.")
+
+        def check_fields(value):
+            if isinstance(value, dict):
+                check_nested(value)
+
+        checks.append(check_fields)
+
+    if "values" in spec:
+        check_value = _compile_spec(spec["values"], f"{path}.*")
+
+        def check_values(value):
+            if isinstance(value, dict):
+                for item in value.values():
+                    check_value(item)
+
+        checks.append(check_values)
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value):
+        for check in checks:
+            check(value)
+
+    return check_all
+
+
+_TYPE_NAMES = {
+    str: "a string",
+    bool: "a boolean",
+    int: "an integer",
+    float: "a number",
+    list: "an array",
+    dict: "an object",
+}
@@ -0,0 +1,37 @@
+# Every secret is stored as one row per share: "{base}#group:{name}" rows
+# carry shared_with_groups, "{base}#user:{sub}" rows carry shared_with_users.
+# The attribute that does not apply is left off, so the two GSIs keyed on
+# them are sparse. Rows written before that carry the "NONE" placeholder
+# instead, and the key of an unshared secret's rows still ends in
+# "group:NONE" / "user:NONE".
+NONE = "NONE"
+
+
+def share_attributes(group=None, user=None):
+    """The shared_with_* attributes for a share row, without placeholders."""
+    attributes = {}
+    if group and group != NONE:
+        attributes["shared_with_groups"] = {"S": group}
+    if user and user != NONE:
+        attributes["shared_with_users"] = {"S": user}
+    return attributes
+
+
+def row_share(item, attribute):
+    """The value of ``attribute`` on a row, or None if absent or "NONE"."""
+    value = item.get(attribute, {}).get("S")
+    return value if value and value != NONE else None
+
+
+def existing_shares(items):
+    """(users, groups) a secret is shared with, from its rows, in row order."""
+    users = []
+    groups = []
+    for item in items:
+        user = row_share(item, "shared_with_users")
+        if user and user not in users:
+            users.append(user)
+        group = row_share(item, "shared_with_groups")
+        if group and group not in groups:
+            groups.append(group)
+    return users, groups
@@ -1,37 +1,193 @@
 import os
 import json
 import re
-import requests
-from jose import jwt
-from jose.exceptions import JWTError
+import base64
+import hashlib
+
+from . import codec
+from . import compression
+from .cache import LRUCache
+from .jwks import JWKSCache
+from .schema import ValidationError
 
 USER_POOL_ID = os.environ["USER_POOL_ID"]
 AWS_REGION = os.environ["AWS_REGION"]
 
 JWKS_URL = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{USER_POOL_ID}/.well-known/jwks.json"
-JWKS_KEYS = requests.get(JWKS_URL).json()["keys"]
+JWKS_TTL_SECONDS = int(os.environ.get("JWKS_TTL_SECONDS", "3600"))
+JWKS_MIN_REFRESH_SECONDS = int(os.environ.get("JWKS_MIN_REFRESH_SECONDS", "60"))
+
+_jwks_cache = JWKSCache(
+    JWKS_URL,
+    ttl=JWKS_TTL_SECONDS,
+    min_refresh_interval=JWKS_MIN_REFRESH_SECONDS,
+)
+
+CLAIMS_CACHE_SIZE = int(os.environ.get("CLAIMS_CACHE_SIZE", "256"))
+_claims_cache = LRUCache(maxsize=CLAIMS_CACHE_SIZE)
+
+# Every route is already protected by the HTTP API Cognito JWT authorizer.
+# Deployments that opt in read the claims it validated instead of verifying
+# the token a second time in the handler.
+TRUST_API_AUTHORIZER = os.environ.get("TRUST_API_AUTHORIZER", "false").lower() in ("1", "true", "yes")
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "4096"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+# Browsers may keep a private copy but must revalidate it with If-None-Match.
+CACHE_CONTROL = os.environ.get("CACHE_CONTROL", "private, no-cache")
 
 
 def get_signing_key(kid):
-    for key in JWKS_KEYS:
-        if key["kid"] == kid:
-            return key
-    raise Exception("Public key not found in JWKS")
+    return _jwks_cache.get(kid)
 
 
 def verify_token(token):
+    # The same token is sent on every call until it expires, so verified
+    # claims are cached by token digest until the token's own exp.
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = _claims_cache.get(digest)
+    if claims is not None:
+        return dict(claims)
+
+    import jwt
+
     try:
         unverified_header = jwt.get_unverified_header(token)
         kid = unverified_header.get("kid")
         if not kid:
             raise Exception("Invalid token: Missing key ID")
         signing_key = get_signing_key(kid)
-        return jwt.decode(token, signing_key, algorithms=["RS256"], audience=None)
-    except JWTError as e:
+        claims = jwt.decode(
+            token,
+            signing_key,
+            algorithms=["RS256"],
+            options={"verify_aud": False},
+        )
+    except jwt.PyJWTError as e:
         raise Exception(f"Unauthorized: {str(e)}")
 
+    exp = claims.get("exp")
+    if isinstance(exp, (int, float)):
+        _claims_cache.set(digest, claims, expires_at=exp)
+    return dict(claims)
+
+
+def claims_cache_stats():
+    return _claims_cache.stats()
+
+
+def normalize_groups(groups):
+    """Return cognito:groups as a list.
+
+    Verified tokens carry a JSON array, while the payload v2 authorizer
+    context flattens it to a string such as "[Admin Users]".
+    """
+    if not groups:
+        return []
+    if isinstance(groups, (list, tuple)):
+        return [str(group) for group in groups if group]
+    groups = str(groups).strip()
+    if groups.startswith("[") and '"' in groups:
+        try:
+            parsed = json.loads(groups)
+            if isinstance(parsed, list):
+                return [str(group) for group in parsed if group]
+        except json.JSONDecodeError:
+            pass
+    return [group for group in re.split(r"[\s,\[\]\"]+", groups) if group]
+
+
+def get_authorizer_claims(event):
+    request_context = event.get("requestContext") or {}
+    authorizer = request_context.get("authorizer") or {}
+    return (authorizer.get("jwt") or {}).get("claims") or {}
+
+
+def get_claims(event):
+    """Return the caller's claims with cognito:groups normalized to a list.
+
+    With TRUST_API_AUTHORIZER enabled the claims come from the API Gateway
+    authorizer context; otherwise (or if the context is missing) the bearer
+    token is fully verified.
+    """
+    claims = get_authorizer_claims(event) if TRUST_API_AUTHORIZER else {}
+    if claims.get("sub"):
+        claims = dict(claims)
+    else:
+        claims = verify_token(get_auth_token(event))
+    claims["cognito:groups"] = normalize_groups(claims.get("cognito:groups"))
+    return claims
+
+
+def get_header(event, name):
+    headers = event.get("headers") or {}
+    return headers.get(name.lower()) or headers.get(name)
 
-def format_response(status_code, body, headers=None):
+
+def format_response(status_code, body, headers=None, event=None):
+    """Build a payload v2 response.
+
+    When the request ``event`` is passed, bodies of at least
+    COMPRESSION_MIN_BYTES are compressed with the best coding the client
+    accepts (brotli if installed, then gzip) and returned base64-encoded.
+    """
+    return _build_response(status_code, codec.dumps(body), headers, event)
+
+
+def format_cacheable_response(body, event, version=None, headers=None):
+    """Build a 200 response with a strong ETag for a GET endpoint.
+
+    The ETag is a hash of the serialized body, or of ``version`` when the
+    caller has a cheaper token that changes whenever the body does (the
+    body is then only serialized if the client's copy is stale). A matching
+    If-None-Match gets an empty 304 instead.
+    """
+    body_text = codec.dumps(body) if version is None else None
+    etag = compute_etag(body_text if version is None else f"version:{version}")
+    cache_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, **(headers or {})}
+    if etag_matches(get_header(event, "If-None-Match"), etag):
+        return {
+            "statusCode": 304,
+            "body": "",
+            "headers": {
+                "Access-Control-Allow-Origin": "*",
+                "Vary": "Accept-Encoding",
+                **cache_headers,
+            },
+        }
+    if body_text is None:
+        body_text = codec.dumps(body)
+    return _build_response(200, body_text, cache_headers, event)
+
+
+def compute_etag(text):
+    return '"' + hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of If-None-Match against ``etag``, ignoring the
+    content-coding suffix added to compressed responses."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        for encoding in ("-br", "-gzip"):
+            if candidate.endswith(encoding):
+                candidate = candidate[:-len(encoding)]
+                break
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _build_response(status_code, body_text, headers, event):
     if headers is None:
         headers = {}
     response_headers = {
@@ -39,58 +195,114 @@ def format_response(status_code, body, headers=None):
         "Access-Control-Allow-Origin": "*",
         **headers,
     }
-    return {
+    response = {
         "statusCode": status_code,
-        "body": json.dumps(body),
+        "body": body_text,
         "headers": response_headers,
     }
+    if event is not None:
+        response_headers["Vary"] = "Accept-Encoding"
+        encoding = compression.choose_encoding(get_header(event, "Accept-Encoding"))
+        data = body_text.encode("utf-8")
+        if encoding and len(data) >= COMPRESSION_MIN_BYTES:
+            compressed = compression.compress(
+                data, encoding, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY
+            )
+            response["body"] = base64.b64encode(compressed).decode("ascii")
+            response["isBase64Encoded"] = True
+            response_headers["Content-Encoding"] = encoding
+            # A strong validator must differ between content-codings.
+            if "ETag" in response_headers:
+                response_headers["ETag"] = response_headers["ETag"][:-1] + f'-{encoding}"'
+    return response
+
+
+MAX_BODY_LENGTH = int(os.environ.get("MAX_BODY_LENGTH", str(256 * 1024)))
+MAX_BODY_DEPTH = int(os.environ.get("MAX_BODY_DEPTH", "16"))
+MAX_BODY_NODES = int(os.environ.get("MAX_BODY_NODES", "5000"))
+
+_ESCAPE_TABLE = str.maketrans({
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "'": "&#39;",
+    "\\": "&#92;",
+    "`": "&#96;",
+})
 
 
 def sanitize_string(value):
     if not isinstance(value, str):
         return value
-    replacements = {
-        "<": "&lt;",
-        ">": "&gt;",
-        '"': "&quot;",
-        "'": "&#39;",
-        "\\": "&#92;",
-        "`": "&#96;",
-    }
-    for old, new in replacements.items():
-        value = value.replace(old, new)
-    return value
+    return value.translate(_ESCAPE_TABLE)
+
 
+def sanitize_object(obj, skip_fields=(), max_depth=MAX_BODY_DEPTH, max_nodes=MAX_BODY_NODES):
+    """HTML-escape the string values of a freshly parsed JSON body in place.
 
-def sanitize_object(obj):
-    if obj is None or not isinstance(obj, (dict, list)):
+    The tree is walked iteratively. Values under a key listed in
+    ``skip_fields`` (ciphertext, IDs) are left untouched at any depth, and
+    string items of arrays are not escaped, as before. Bodies nested deeper
+    than ``max_depth`` or with more than ``max_nodes`` values are rejected.
+    """
+    if not isinstance(obj, (dict, list)):
         return obj
-    if isinstance(obj, list):
-        return [sanitize_object(item) for item in obj]
-    sanitized = {}
-    for key, value in obj.items():
-        if isinstance(value, str):
-            sanitized[key] = sanitize_string(value)
-        elif isinstance(value, (dict, list)):
-            sanitized[key] = sanitize_object(value)
+    escape_table = _ESCAPE_TABLE
+    nodes = 0
+    stack = [(obj, 1)]
+    while stack:
+        container, depth = stack.pop()
+        if depth > max_depth:
+            raise ValidationError(f"Invalid request: body is nested deeper than {max_depth} levels")
+        nodes += len(container)
+        if nodes > max_nodes:
+            raise ValidationError(f"Invalid request: body has more than {max_nodes} values")
+        if isinstance(container, dict):
+            for key, value in container.items():
+                if key in skip_fields:
+                    continue
+                if isinstance(value, str):
+                    container[key] = value.translate(escape_table)
+                elif isinstance(value, (dict, list)):
+                    stack.append((value, depth + 1))
         else:
-            sanitized[key] = value
-    return sanitized
+            for value in container:
+                if isinstance(value, (dict, list)):
+                    stack.append((value, depth + 1))
+    return obj
+
+
+def parse_body(body, skip_fields=(), max_length=None, schema=None):
+    """Parse, validate and sanitize a JSON request body.
 
+    The raw length is checked against ``max_length`` (default: the
+    schema's max_body_length, then MAX_BODY_LENGTH) before anything is
+    parsed, and the compiled ``schema`` runs before sanitizing so limits
+    apply to what the client sent. Failures raise ValidationError.
 
-def parse_body(body):
+    Object string values are HTML-escaped so that free text such as notes
+    and usernames is safe to render. ``skip_fields`` lists the fields a
+    handler needs exactly as sent: ciphertext, which escaping would
+    corrupt, and IDs that are written into or matched against table keys.
+    Each handler declares its own list.
+    """
+    if max_length is None:
+        max_length = getattr(schema, "max_body_length", None) or MAX_BODY_LENGTH
     if not body:
-        raise Exception("No body provided")
+        raise ValidationError("No body provided")
+    if len(body) > max_length:
+        raise ValidationError(f"Invalid request: body exceeds {max_length} characters")
     try:
-        parsed = json.loads(body)
-        return sanitize_object(parsed)
-    except json.JSONDecodeError:
-        raise Exception("Body is not valid JSON")
+        parsed = codec.loads(body)
+    except codec.JSONDecodeError:
+        raise ValidationError("Body is not valid JSON")
+    if schema is not None:
+        schema(parsed)
+    return sanitize_object(parsed, skip_fields=skip_fields)
 
 
 def get_auth_token(event):
-    headers = event.get("headers", {})
-    auth_header = headers.get("authorization") or headers.get("Authorization")
+    auth_header = get_header(event, "Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise Exception("Unauthorized: No token provided")
     return auth_header.split(" ")[1]
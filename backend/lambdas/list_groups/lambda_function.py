@@ -1,7 +1,6 @@
 import os
-import boto3
 import logging
-from jwtlib import verify_token, format_response, get_auth_token
+from jwtlib import get_claims, format_response, format_cacheable_response, LazyClient
 
 # Configure logging
 logger = logging.getLogger()
@@ -10,17 +9,14 @@ logger.setLevel(logging.INFO)
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 AWS_REGION = os.environ.get("AWS_REGION")
 
-cognito = boto3.client("cognito-idp", region_name=AWS_REGION)
+cognito = LazyClient("cognito-idp", region_name=AWS_REGION)
 
 def lambda_handler(event, context):
     logger.info("Lambda invoked")
     logger.debug(f"Event received: {event}")
 
     try:
-        token = get_auth_token(event)
-        logger.info("Token extracted from event")
-
-        verify_token(token)
+        get_claims(event)
         logger.info("Token verified successfully")
 
         params = {
@@ -53,7 +49,7 @@ def lambda_handler(event, context):
         result = {
             "groups": [{"value": g["GroupName"], "label": g["GroupName"]} for g in groups]
         }
-        return format_response(200, result)
+        return format_cacheable_response(result, event)
 
     except Exception as e:
         logger.exception("Unhandled exception occurred")  # Logs traceback
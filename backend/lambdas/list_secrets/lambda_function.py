@@ -1,65 +1,737 @@
-import json
+import base64
+import binascii
+import hashlib
 import os
-import boto3
-from botocore.exceptions import ClientError
-from jwtlib import verify_token, format_response, get_auth_token
+import time
+from concurrent.futures import ThreadPoolExecutor
+from jwtlib import get_claims, format_response, format_cacheable_response, LazyClient, RawJSON, ValidationError, codec
+from jwtlib.batch import batch_get
+from jwtlib.cache import LRUCache
+from jwtlib.changes import CHANGE_RETENTION_SECONDS, now_ms
+from jwtlib.revisions import read_group_revisions
 
-dynamodb = boto3.client('dynamodb')
 TABLE_PREFIX = os.environ.get('TABLE_PREFIX', 'RunaVault_')
+PASSWORDS_TABLE = f"{TABLE_PREFIX}passwords"
+CHANGES_TABLE = f"{TABLE_PREFIX}changes"
+ACCESS_TABLE = f"{TABLE_PREFIX}access"
+# GSIs on the share attributes; the stack passes the lean ones once deployed.
+GROUPS_INDEX = os.environ.get('GROUPS_INDEX', 'shared_with_groups-lean-index')
+USERS_INDEX = os.environ.get('USERS_INDEX', 'shared_with_users-lean-index')
+REVISIONS_TABLE = f"{TABLE_PREFIX}revisions"
+# With the stream-maintained access view deployed, a listing is a single
+# query on the caller's partition of it instead of 2 + G queries.
+USE_ACCESS_VIEW = os.environ.get('USE_ACCESS_VIEW', 'false').lower() in ('1', 'true', 'yes')
 
-def get_auth_token(event):
-    headers = event.get('headers', {})
-    auth_header = headers.get('Authorization') or headers.get('authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        return auth_header[7:]
-    raise Exception("Unauthorized: No token provided")
+# The owner, per-group and direct-share queries are independent, so they run
+# side by side. The pool lives for the life of the container and the
+# DynamoDB client's connection pool is sized to match it.
+QUERY_CONCURRENCY = int(os.environ.get('QUERY_CONCURRENCY', '8'))
+query_executor = ThreadPoolExecutor(max_workers=QUERY_CONCURRENCY, thread_name_prefix='query')
+dynamodb = LazyClient('dynamodb', max_pool_connections=QUERY_CONCURRENCY)
 
+# Every member of a group reads the same GROUPS_INDEX partition, so warm
+# containers keep each group's rows and reuse them while the group's
+# revision (bumped by the writers) is unchanged. Groups with more rows
+# than GROUP_CACHE_MAX_ROWS are always queried. Entries also expire after
+# GROUP_CACHE_TTL_SECONDS in case a writer failed to bump.
+# GROUPS_INDEX is eventually consistent, so a query just after a bump can
+# miss the write that caused it. Groups bumped in the last
+# GROUP_CACHE_SETTLE_MS are queried without caching the result; should
+# the index lag longer than that, the stale rows are served for up to
+# GROUP_CACHE_TTL_SECONDS or until the group's next bump.
+GROUP_CACHE_SIZE = int(os.environ.get('GROUP_CACHE_SIZE', '64'))
+GROUP_CACHE_MAX_ROWS = int(os.environ.get('GROUP_CACHE_MAX_ROWS', '2000'))
+GROUP_CACHE_TTL_SECONDS = int(os.environ.get('GROUP_CACHE_TTL_SECONDS', '300'))
+GROUP_CACHE_SETTLE_MS = int(os.environ.get('GROUP_CACHE_SETTLE_MS', '5000'))
+group_cache = LRUCache(maxsize=GROUP_CACHE_SIZE)
 
-def format_response(status_code, body):
-    return {
-        'statusCode': status_code,
-        'body': json.dumps(body),
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
+MAX_PAGE_LIMIT = 1000
+# Lambda caps synchronous responses at 6 MB; pages stop well before that so
+# headers and JSON escaping never push a response over.
+MAX_RESPONSE_BYTES = int(os.environ.get('MAX_RESPONSE_BYTES', str(5 * 1024 * 1024)))
+# Rough per-row allowance for keys, punctuation and the fields that are not
+# counted by estimate_size.
+ROW_OVERHEAD_BYTES = 256
+# Rows read through the GSIs carry only the list-view attributes; a full
+# listing fetches the password and notes by key before responding. Until
+# then a lean row is assumed to grow by this much.
+LEAN_ROW_ALLOWANCE_BYTES = int(os.environ.get('LEAN_ROW_ALLOWANCE_BYTES', '4096'))
+
+# Writers file their change entries after the rows are stored, so the
+# watermark handed out trails the clock: entries still in flight are picked
+# up by the next sync instead of being skipped.
+WATERMARK_LAG_MS = int(os.environ.get('WATERMARK_LAG_MS', '60000'))
+# A sync with more changed secrets than this is answered with 410 and the
+# client lists everything again.
+MAX_SYNC_CHANGES = int(os.environ.get('MAX_SYNC_CHANGES', '1000'))
+
+VIEWS = ('full', 'summary')
+# Attributes read for view=summary: what the vault list shows, plus the
+# keys and shares needed to page and merge rows. The password and notes
+# are fetched on demand through get_secret. The share GSIs project exactly
+# these attributes (cdk/runa_vault_stack.py), so summary listings never
+# touch the table itself.
+SUMMARY_ATTRIBUTES = (
+    'user_id', 'site', 'password_id', 'username', 'subdirectory', 'tags', 'favorite',
+    'last_modified', 'version', 'encrypted', 'shared_with_groups', 'shared_with_users', 'shared_with_roles',
+)
+
+FORMATS = ('objects', 'columnar')
+# Fields of a secret in format=columnar: (name, encoding, default). Dotted
+# names are nested fields. "ref" values are indexes into the response's
+# string table, "refs" lists of them and "ref_map" a flat [key, value, ...]
+# list of them. Values equal to the default are sent as null, and columns
+# that are entirely default are left out.
+COLUMNAR_FIELDS = (
+    ('user_id', 'ref', None),
+    ('site', 'value', None),
+    ('password_id', 'value', None),
+    ('subdirectory', 'ref', 'default'),
+    ('username', 'value', None),
+    ('password', 'value', None),
+    ('encrypted', 'value', True),
+    ('shared_with.users', 'refs', []),
+    ('shared_with.groups', 'refs', []),
+    ('shared_with.roles', 'ref_map', {}),
+    ('last_modified', 'value', 'N/A'),
+    ('notes', 'value', ''),
+    ('tags', 'refs', []),
+    ('favorite', 'value', False),
+    ('version', 'value', 1),
+    ('owned_by_me', 'value', False),
+)
+
+
+class ResyncRequired(Exception):
+    """A watermark the change log can no longer serve (HTTP 410)."""
+
+
+def format_password(raw_password):
+    # create_secret and edit_secret only store JSON objects, which are
+    # passed through to the response as is rather than decoded and
+    # re-encoded. Rows edited before that was checked can hold HTML-escaped
+    # JSON ({&quot;encryptedPassword&quot;: ...}) or a bare ciphertext;
+    # only those are decoded, and wrapped if they do not parse.
+    if raw_password.startswith('{') and raw_password.endswith('}') and '&quot;' not in raw_password:
+        return RawJSON(raw_password)
+    try:
+        codec.loads(raw_password)
+    except (ValueError, TypeError):
+        return {'encryptedPassword': raw_password, 'sharedWith': {'users': [], 'groups': []}}
+    return RawJSON(raw_password)
+
+
+def split_share_key(site):
+    """Split a row's sort key into the secret's base key and password_id.
+
+    Rows are keyed ``{site}[#{subdirectory}]#{password_id}#group:{g}`` or
+    ``...#user:{u}``; the base key is what the frontend sends back to
+    edit_secret and delete_secret.
+    """
+    base_site, sep, suffix = site.rpartition('#')
+    if not sep or not suffix.startswith(('group:', 'user:')):
+        base_site = site
+    return base_site, base_site.rpartition('#')[2]
+
+
+class _Secret:
+    __slots__ = ('item', 'base_site', 'password_id', 'owned_by_me', 'users', 'groups', 'roles')
+
+    def __init__(self, item, base_site, password_id, owned_by_me):
+        self.item = item
+        self.base_site = base_site
+        self.password_id = password_id
+        self.owned_by_me = owned_by_me
+        self.users = set()
+        self.groups = set()
+        self.roles = {}
+
+    def add_share(self, item):
+        user = item.get('shared_with_users', {}).get('S')
+        if user and user != 'NONE':
+            self.users.add(user)
+        group = item.get('shared_with_groups', {}).get('S')
+        if group and group != 'NONE':
+            self.groups.add(group)
+        for name, role in item.get('shared_with_roles', {}).get('M', {}).items():
+            self.roles[name] = role['S']
+
+    def sort_key(self):
+        return (self.base_site.lower(), self.item['user_id']['S'], self.password_id)
+
+    def to_dict(self, summary=False):
+        item = self.item
+        tags = item.get('tags', {}).get('SS', [])
+        secret = {
+            'user_id': item['user_id']['S'],
+            'site': self.base_site,
+            'password_id': self.password_id,
+            'subdirectory': item.get('subdirectory', {}).get('S', 'default'),
+            'username': item['username']['S'],
+            'encrypted': item.get('encrypted', {}).get('BOOL', True),
+            'shared_with': {
+                'users': sorted(self.users),
+                'groups': sorted(self.groups),
+                'roles': self.roles,
+            },
+            'last_modified': item.get('last_modified', {}).get('S', 'N/A'),
+            'tags': [] if not tags or tags[0] == 'NONE' else tags,
+            'favorite': item.get('favorite', {}).get('BOOL', False),
+            'version': int(item.get('version', {}).get('N', 1)),
+            'owned_by_me': self.owned_by_me,
         }
-    }
+        if not summary:
+            secret['password'] = format_password(item['password']['S'])
+            secret['notes'] = item.get('notes', {}).get('S', '')
+        return secret
+
+
+class SecretCoalescer:
+    """Merges fan-out rows into one secret per (owner, password_id).
+
+    create_secret writes a row for every group and user a secret is shared
+    with, each carrying a single shared_with_* value. Rows are added as
+    they stream in from the queries: the first row of a secret supplies
+    its fields, later rows only add their share to the sets. The password
+    of each secret is formatted once, when the merged secrets are iterated
+    in site order. With ``summary`` set, rows come from a projected query
+    and secrets are returned without their password and notes.
+    """
+
+    def __init__(self, summary=False):
+        self.summary = summary
+        self._secrets = {}
+
+    @staticmethod
+    def key(item):
+        password_id = item.get('password_id', {}).get('S')
+        if password_id:
+            base_site = None
+        else:
+            base_site, password_id = split_share_key(item['site']['S'])
+        return item['user_id']['S'], password_id, base_site
+
+    def add(self, item, owned_by_me):
+        """Add a row. Returns True if it starts a new secret."""
+        owner, password_id, base_site = self.key(item)
+        secret = self._secrets.get((owner, password_id))
+        is_new = secret is None
+        if is_new:
+            if base_site is None:
+                base_site = split_share_key(item['site']['S'])[0]
+            secret = self._secrets[(owner, password_id)] = _Secret(item, base_site, password_id, owned_by_me)
+        secret.add_share(item)
+        return is_new
+
+    def __contains__(self, item):
+        owner, password_id, _ = self.key(item)
+        return (owner, password_id) in self._secrets
+
+    def __len__(self):
+        return len(self._secrets)
 
-def format_secret(item):
+    def hydrate(self, fetch):
+        """Swap rows without a password for the full items.
+
+        ``fetch`` takes a list of table keys and returns the items found.
+        Secrets whose row is gone by now (deleted or being rewritten) are
+        dropped from the page.
+        """
+        lean = [key for key, secret in self._secrets.items() if 'password' not in secret.item]
+        if self.summary or not lean:
+            return 0
+        rows = [self._secrets[key].item for key in lean]
+        found = {
+            (item['user_id']['S'], item['site']['S']): item
+            for item in fetch([{'user_id': row['user_id'], 'site': row['site']} for row in rows])
+        }
+        for key, row in zip(lean, rows):
+            item = found.get((row['user_id']['S'], row['site']['S']))
+            if item is None:
+                print(f"Dropping {key[0]}/{key[1]}: row disappeared before hydration")
+                del self._secrets[key]
+            else:
+                self._secrets[key].item = item
+        return len(lean)
+
+    def __iter__(self):
+        for secret in sorted(self._secrets.values(), key=_Secret.sort_key):
+            yield secret.to_dict(self.summary)
+
+
+def estimate_size(item):
+    """Upper-bound guess of the JSON size of a row once formatted."""
+    size = ROW_OVERHEAD_BYTES
+    for value in item.values():
+        if 'S' in value:
+            size += len(value['S'])
+        elif 'SS' in value:
+            size += sum(len(tag) + 3 for tag in value['SS'])
+        elif 'M' in value:
+            size += sum(len(k) + 12 for k in value['M'])
+    return size
+
+
+def access_phases(user_id, user_groups, attributes=None):
+    """The queries that make up a listing, in the order they are paged.
+
+    Owned secrets come first, then each group's share rows (groups sorted
+    by name), then rows shared directly with the user. With USE_ACCESS_VIEW
+    there is a single phase reading the caller's access-view partition.
+    Group phases carry their ``group`` so their rows can be cached.
+    ``key_attrs`` identify a position inside the phase; ``skip_owned``
+    phases drop the caller's own rows unless they are the view's
+    ``owner#`` entries, so owned secrets always come from the owner rows.
+    ``attributes`` limits every query to those attributes (plus the keys)
+    through a ProjectionExpression, less the ``unprojected`` ones a GSI
+    does not carry.
+    """
+    if USE_ACCESS_VIEW:
+        phases = [{
+            'id': 'access',
+            'table': ACCESS_TABLE,
+            'key_attrs': ('recipient', 'entry_key'),
+            'skip_owned': True,
+            'query': {
+                'KeyConditionExpression': "recipient = :user_id",
+                'ExpressionAttributeValues': {":user_id": {'S': user_id}},
+            },
+        }]
+    else:
+        phases = [{
+            'id': 'owner',
+            'table': PASSWORDS_TABLE,
+            'key_attrs': ('user_id', 'site'),
+            'skip_owned': False,
+            'query': {
+                'KeyConditionExpression': "user_id = :user_id",
+                'ExpressionAttributeValues': {":user_id": {'S': user_id}},
+            },
+        }]
+        # Legacy rows carry shared_with_groups = "NONE"; that partition is
+        # not a group and is never read.
+        for group in sorted(set(user_groups) - {'NONE'}):
+            phases.append({
+                'id': f'group:{group}',
+                'group': group,
+                'table': PASSWORDS_TABLE,
+                'key_attrs': ('user_id', 'site', 'shared_with_groups'),
+                'unprojected': ('shared_with_users',),
+                'skip_owned': True,
+                'query': {
+                    'IndexName': GROUPS_INDEX,
+                    'KeyConditionExpression': "shared_with_groups = :group_id",
+                    'ExpressionAttributeValues': {":group_id": {'S': group}},
+                },
+            })
+        phases.append({
+            'id': 'users',
+            'table': PASSWORDS_TABLE,
+            'key_attrs': ('user_id', 'site', 'shared_with_users'),
+            'unprojected': ('shared_with_groups',),
+            'skip_owned': True,
+            'query': {
+                'IndexName': USERS_INDEX,
+                'KeyConditionExpression': "shared_with_users = :user_id",
+                'ExpressionAttributeValues': {":user_id": {'S': user_id}},
+            },
+        })
+    if attributes:
+        for phase in phases:
+            unprojected = phase.get('unprojected', ())
+            extra_keys = tuple(attr for attr in phase['key_attrs'] if attr not in attributes)
+            phase['query'].update(projection(tuple(a for a in attributes if a not in unprojected) + extra_keys))
+    return phases
+
+
+def projection(attributes):
+    names = {f"#a{i}": name for i, name in enumerate(attributes)}
+    return {'ProjectionExpression': ", ".join(names), 'ExpressionAttributeNames': names}
+
+
+def is_owner_entry(item):
+    return item.get('entry_key', {}).get('S', '').startswith('owner#')
+
+
+def item_key(phase, item):
+    return {attr: item[attr] for attr in phase['key_attrs']}
+
+
+def encode_cursor(phase_id, start_key=None):
+    payload = codec.dumps({'p': phase_id, 'k': start_key})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, phases):
+    """Return (phase index, ExclusiveStartKey) for a cursor from a previous page."""
     try:
-        password_data = json.loads(item['password']['S'])
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = codec.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, binascii.Error, codec.JSONDecodeError):
+        raise ValidationError("Invalid cursor")
+
+    if not isinstance(payload, dict):
+        raise ValidationError("Invalid cursor")
+    phase_id = payload.get('p')
+    start_key = payload.get('k')
+    if start_key is not None and not (
+        isinstance(start_key, dict)
+        and all(isinstance(v, dict) and isinstance(v.get('S'), str) and len(v) == 1 for v in start_key.values())
+    ):
+        raise ValidationError("Invalid cursor")
+
+    for index, phase in enumerate(phases):
+        if phase['id'] == phase_id:
+            return index, start_key
+    # The group the cursor points into is no longer in the caller's token.
+    raise ValidationError("Invalid cursor")
+
+
+def groups_digest(user_groups):
+    return hashlib.blake2b("\n".join(sorted(set(user_groups))).encode('utf-8'), digest_size=4).hexdigest()
+
+
+def make_watermark(user_groups, at_ms):
+    """Watermark for a listing or sync that started at ``at_ms``.
+
+    It carries a digest of the caller's groups, since a change in group
+    membership changes what is visible without any secret changing.
+    """
+    return f"{max(at_ms - WATERMARK_LAG_MS, 0)}.{groups_digest(user_groups)}"
+
+
+def parse_watermark(watermark, user_groups):
+    """Return the change-log timestamp a client's watermark stands for."""
+    since_ms, _, digest = watermark.partition('.')
+    if not since_ms.isdigit() or not digest:
+        raise ValidationError("Invalid watermark")
+    if digest != groups_digest(user_groups):
+        raise ResyncRequired("Group membership changed since the last sync")
+    since_ms = int(since_ms)
+    if since_ms < now_ms() - CHANGE_RETENTION_SECONDS * 1000:
+        raise ResyncRequired("Watermark has expired")
+    return since_ms
+
+
+def parse_page_params(event):
+    params = event.get('queryStringParameters') or {}
+    limit = params.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValidationError("Invalid request: limit must be an integer")
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise ValidationError(f"Invalid request: limit must be between 1 and {MAX_PAGE_LIMIT}")
+    view = params.get('view') or 'full'
+    if view not in VIEWS:
+        raise ValidationError(f"Invalid request: view must be one of {', '.join(VIEWS)}")
+    response_format = params.get('format') or 'objects'
+    if response_format not in FORMATS:
+        raise ValidationError(f"Invalid request: format must be one of {', '.join(FORMATS)}")
+    cursor = params.get('cursor') or None
+    since = params.get('since') or None
+    if since and (cursor or limit is not None):
+        raise ValidationError("Invalid request: since cannot be combined with cursor or limit")
+    return limit, cursor, view, response_format, since
+
+
+def query_phase(phase, start_key=None, max_items=None):
+    """Read a phase from ``start_key`` on, following LastEvaluatedKey.
+
+    Stops once ``max_items`` rows have been read. Returns the rows, whether
+    the phase has more after them, and timings for the log.
+    """
+    started = time.perf_counter()
+    params = {'TableName': phase['table'], **phase['query']}
+    items = []
+    pages = 0
+    while True:
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        if max_items is not None:
+            params['Limit'] = max_items - len(items)
+        response = dynamodb.query(**params)
+        pages += 1
+        items.extend(response.get('Items', []))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key or (max_items is not None and len(items) >= max_items):
+            timing = {
+                'phase': phase['id'],
+                'pages': pages,
+                'rows': len(items),
+                'ms': round((time.perf_counter() - started) * 1000, 1),
+            }
+            return items, start_key is not None, timing
+
+
+def group_revisions(groups):
+    """Current revisions of ``groups``, or {} if they cannot be read."""
+    try:
+        return read_group_revisions(dynamodb, REVISIONS_TABLE, groups, settle_ms=GROUP_CACHE_SETTLE_MS)
     except Exception as e:
-        print(f"Failed to parse password: {e}")
-        password_data = {'encryptedPassword': item['password']['S'], 'sharedWith': {'users': [], 'groups': []}}
+        print(f"Group revisions unavailable, not using the cache: {e}")
+        return {}
 
-    site = item['site']['S']
-    base_site = site.split('#group:')[0].split('#user:')[0]
 
-    return {
-        'user_id': item['user_id']['S'],
-        'site': base_site,
-        'password_id': item.get('password_id', {}).get('S', base_site.split('#')[2] if len(base_site.split('#')) > 2 else ''),
-        'subdirectory': item.get('subdirectory', {}).get('S', 'default'),
-        'username': item['username']['S'],
-        'password': password_data,
-        'encrypted': item.get('encrypted', {}).get('BOOL', True),
-        'shared_with': {
-            'users': [item['shared_with_users']['S']] if item.get('shared_with_users', {}).get('S') and item['shared_with_users']['S'] != 'NONE' else [],
-            'groups': [item['shared_with_groups']['S']] if item.get('shared_with_groups', {}).get('S') and item['shared_with_groups']['S'] != 'NONE' else [],
-            'roles': {k: v['S'] for k, v in item.get('shared_with_roles', {}).get('M', {}).items()} if 'shared_with_roles' in item else {}
+def cached_group_rows(phase, revision):
+    """All rows of a group phase at ``revision``, or None for groups too
+    large to cache. Reads and caches the partition on a miss."""
+    cache_key = (phase['id'], phase['query'].get('ProjectionExpression'))
+    cached = group_cache.get(cache_key)
+    if cached is not None and cached[0] == revision:
+        return cached[1]
+    items, has_more, timing = query_phase(phase, max_items=GROUP_CACHE_MAX_ROWS + 1)
+    rows = items if not has_more and len(items) <= GROUP_CACHE_MAX_ROWS else None
+    print(f"Group cache miss: {codec.dumps(timing)}")
+    group_cache.set(cache_key, (revision, rows), expires_at=time.time() + GROUP_CACHE_TTL_SECONDS)
+    return rows
+
+
+def read_phase(phase, start_key, max_items, revisions_future):
+    """query_phase, served from the group cache where possible.
+
+    Cached rows are in the order the query returns them, so a page cut
+    from them resumes with the same keys a real query would use.
+    """
+    if 'group' in phase and revisions_future is not None:
+        revision = revisions_future.result().get(phase['group'])
+        rows = cached_group_rows(phase, revision) if revision is not None else None
+        if rows is not None:
+            start = 0
+            if start_key:
+                start = next((i + 1 for i, row in enumerate(rows) if item_key(phase, row) == start_key), None)
+            if start is not None:
+                end = len(rows) if max_items is None else start + max_items
+                items = rows[start:end]
+                timing = {'phase': phase['id'], 'pages': 0, 'rows': len(items), 'ms': 0, 'cached': True}
+                return items, end < len(rows), timing
+    return query_phase(phase, start_key, max_items)
+
+
+def query_phases(phases, start_index, start_key, limit):
+    """Run the phases from ``start_index`` on concurrently.
+
+    Each phase reads at most ``limit`` rows, since any one of them may end
+    up filling the page. Results are yielded in phase order regardless of
+    which query finishes first, so pages are deterministic; queries for
+    phases after the end of the page are cancelled if they have not
+    started. Group revisions are read first, with one BatchGetItem, for
+    the group phases to check their cached rows against.
+    """
+    groups = [phase['group'] for phase in phases[start_index:] if 'group' in phase]
+    revisions_future = query_executor.submit(group_revisions, groups) if groups and GROUP_CACHE_SIZE > 0 else None
+    futures = [
+        query_executor.submit(
+            read_phase, phases[index], start_key if index == start_index else None, limit, revisions_future,
+        )
+        for index in range(start_index, len(phases))
+    ]
+    try:
+        for index, future in enumerate(futures, start_index):
+            yield index, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def collect_page(user_id, phases, start_index=0, start_key=None, limit=None, summary=False):
+    """Gather one page of secrets across the phases.
+
+    The page ends after ``limit`` secrets or before the estimated body size
+    reaches MAX_RESPONSE_BYTES. Returns a SecretCoalescer and the cursor for the
+    next page, or None once every phase has been read.
+    """
+    secrets = SecretCoalescer(summary)
+    size = 0
+    timings = []
+    try:
+        for index, (items, has_more, timing) in query_phases(phases, start_index, start_key, limit):
+            phase = phases[index]
+            timings.append(timing)
+            resume_key = start_key if index == start_index else None
+
+            for item in items:
+                owner = item['user_id']['S']
+                # Owned rows were already returned by the owner phase.
+                if phase['skip_owned'] and owner == user_id and not is_owner_entry(item):
+                    resume_key = item_key(phase, item)
+                    continue
+                # Further shares of a secret already on the page do not count
+                # against the limit, so its rows stay together where possible.
+                if item not in secrets:
+                    if limit is not None and len(secrets) >= limit:
+                        return secrets, encode_cursor(phase['id'], resume_key)
+                    item_size = estimate_size(item)
+                    if not summary and 'password' not in item:
+                        item_size += LEAN_ROW_ALLOWANCE_BYTES
+                    if secrets and size + item_size > MAX_RESPONSE_BYTES:
+                        print(f"Ending page at {len(secrets)} secrets (~{size} bytes)")
+                        return secrets, encode_cursor(phase['id'], resume_key)
+                    size += item_size
+                secrets.add(item, owner == user_id)
+                resume_key = item_key(phase, item)
+
+            if has_more:
+                return secrets, encode_cursor(phase['id'], resume_key)
+            if limit is not None and len(secrets) >= limit:
+                if index + 1 < len(phases):
+                    return secrets, encode_cursor(phases[index + 1]['id'])
+                return secrets, None
+        return secrets, None
+    finally:
+        print(f"Query timings: {codec.dumps(timings)}")
+
+
+def hydrate_page(secrets):
+    """Fetch full items for the secrets whose rows came from a GSI."""
+    started = time.perf_counter()
+    count = secrets.hydrate(lambda keys: batch_get(dynamodb, PASSWORDS_TABLE, keys, executor=query_executor))
+    if count:
+        print(f"Hydrated {count} secrets in {round((time.perf_counter() - started) * 1000, 1)} ms")
+
+
+def query_changes(audience, since_ms):
+    """Change entries filed under ``audience`` at or after ``since_ms``."""
+    params = {
+        'TableName': CHANGES_TABLE,
+        'KeyConditionExpression': "audience = :audience AND change_key >= :since",
+        'ExpressionAttributeValues': {
+            ':audience': {'S': audience},
+            ':since': {'S': f"{since_ms:013d}"},
         },
-        'last_modified': item.get('last_modified', {}).get('S', 'N/A'),
-        'notes': item.get('notes', {}).get('S', ''),
-        'tags': [] if item.get('tags', {}).get('SS', ['NONE'])[0] == 'NONE' else item.get('tags', {}).get('SS', []),
-        'favorite': item.get('favorite', {}).get('BOOL', False),
-        'version': int(item.get('version', {}).get('N', 1))
+    }
+    entries = []
+    while True:
+        response = dynamodb.query(**params)
+        entries.extend(response.get('Items', []))
+        if len(entries) > MAX_SYNC_CHANGES:
+            raise ResyncRequired("Too many changes since the last sync")
+        if 'LastEvaluatedKey' not in response:
+            return entries
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def read_secret_rows(owner, site, attributes=None):
+    """All current rows of the secret whose base key is ``site``."""
+    params = {
+        'TableName': PASSWORDS_TABLE,
+        'KeyConditionExpression': "user_id = :owner AND begins_with(site, :prefix)",
+        'ExpressionAttributeValues': {':owner': {'S': owner}, ':prefix': {'S': f"{site}#"}},
+    }
+    if attributes:
+        params.update(projection(attributes))
+    rows = []
+    while True:
+        response = dynamodb.query(**params)
+        rows.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return rows
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def sync_changes(user_id, user_groups, since_ms, summary=False):
+    """Secrets changed since ``since_ms`` and tombstones for lost ones.
+
+    The change log only says which secrets to look at. Each one is re-read
+    and returned if the caller can still see it; otherwise (deleted, or
+    unshared from the caller and their groups) it becomes a tombstone.
+    """
+    audiences = [f"owner:{user_id}", *(f"group:{group}" for group in sorted(set(user_groups))), f"user:{user_id}"]
+    latest = {}
+    for entries in query_executor.map(lambda audience: query_changes(audience, since_ms), audiences):
+        for entry in entries:
+            key = (entry['owner']['S'], entry['password_id']['S'])
+            if key not in latest or entry['change_key']['S'] > latest[key]['change_key']['S']:
+                latest[key] = entry
+    if len(latest) > MAX_SYNC_CHANGES:
+        raise ResyncRequired("Too many changes since the last sync")
+    print(f"Sync: {len(latest)} changed secrets since {since_ms}")
+
+    attributes = SUMMARY_ATTRIBUTES if summary else None
+    group_set = set(user_groups)
+    secrets = SecretCoalescer(summary)
+    deleted = []
+    rows_per_secret = query_executor.map(
+        lambda entry: read_secret_rows(entry['owner']['S'], entry['site']['S'], attributes),
+        latest.values(),
+    )
+    for ((owner, password_id), entry), rows in zip(latest.items(), rows_per_secret):
+        visible = [
+            row for row in rows
+            if owner == user_id
+            or row.get('shared_with_users', {}).get('S') == user_id
+            or row.get('shared_with_groups', {}).get('S') in group_set
+        ]
+        if not visible:
+            deleted.append({'user_id': owner, 'password_id': password_id, 'site': entry['site']['S']})
+            continue
+        for row in visible:
+            secrets.add(row, owner == user_id)
+    return secrets, deleted
+
+
+def to_columnar(secrets):
+    """Encode formatted secrets as parallel column arrays.
+
+    Owner IDs, subdirectories, share targets, roles and tags repeat across
+    a vault, so they are stored once in ``strings`` and referenced by
+    index.
+    """
+    strings = []
+    refs = {}
+
+    def ref(value):
+        index = refs.get(value)
+        if index is None:
+            index = refs[value] = len(strings)
+            strings.append(value)
+        return index
+
+    encoders = {
+        'value': lambda value: value,
+        'ref': ref,
+        'refs': lambda values: [ref(value) for value in values],
+        'ref_map': lambda mapping: [ref(part) for pair in mapping.items() for part in pair],
+    }
+
+    columns = {}
+    defaults = {}
+    for name, encoding, default in COLUMNAR_FIELDS:
+        path = name.split('.')
+        encode = encoders[encoding]
+        values = []
+        exists = present = False
+        for secret in secrets:
+            value = secret
+            for part in path:
+                value = value.get(part)
+            if value is not None:
+                exists = True
+            if value is None or value == default:
+                values.append(None)
+            else:
+                values.append(encode(value))
+                present = True
+        # Fields a view leaves out (such as the password in view=summary)
+        # get neither a column nor a default.
+        if exists and default is not None:
+            defaults[name] = default
+        if present:
+            columns[name] = {'encoding': encoding, 'values': values}
+
+    return {
+        'format': 'columnar',
+        'count': len(secrets),
+        'strings': strings,
+        'defaults': defaults,
+        'columns': columns,
     }
 
 
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded = verify_token(token)
+        decoded = get_claims(event)
 
         user_id = decoded.get('sub')
         user_groups = decoded.get('cognito:groups', [])
@@ -67,62 +739,45 @@ def lambda_handler(event, context):
         if not user_id:
             return format_response(400, {'message': 'Invalid token: Missing userId'})
 
-        print(f"Fetching secrets for user: {user_id}")
+        limit, cursor, view, response_format, since = parse_page_params(event)
+        summary = view == 'summary'
+        started_ms = now_ms()
 
-        user_secrets_resp = dynamodb.query(
-            TableName=f"{TABLE_PREFIX}passwords",
-            KeyConditionExpression="user_id = :user_id",
-            ExpressionAttributeValues={":user_id": {'S': user_id}}
-        )
-        user_secrets = [
-            {**format_secret(item), 'owned_by_me': True}
-            for item in user_secrets_resp.get('Items', [])
-        ]
-        print(f"User owns {len(user_secrets)} secrets")
-
-        group_secrets = []
-        if user_groups:
-            for group in user_groups:
-                response = dynamodb.query(
-                    TableName=f"{TABLE_PREFIX}passwords",
-                    IndexName="shared_with_groups-index",
-                    KeyConditionExpression="shared_with_groups = :group_id",
-                    ExpressionAttributeValues={":group_id": {'S': group}}
-                )
-                for item in response.get('Items', []):
-                    if item['user_id']['S'] != user_id:
-                        group_secrets.append({**format_secret(item), 'owned_by_me': False})
-
-        print(f"User has access to {len(group_secrets)} secrets via groups")
-
-        user_shared_resp = dynamodb.query(
-            TableName=f"{TABLE_PREFIX}passwords",
-            IndexName="shared_with_users-index",
-            KeyConditionExpression="shared_with_users = :user_id",
-            ExpressionAttributeValues={":user_id": {'S': user_id}}
-        )
-        user_shared_secrets = [
-            {**format_secret(item), 'owned_by_me': item['user_id']['S'] == user_id}
-            for item in user_shared_resp.get('Items', [])
-        ]
-        print(f"User has {len(user_shared_secrets)} secrets shared directly with them")
+        if since:
+            since_ms = parse_watermark(since, user_groups)
+            print(f"Syncing secrets for user: {user_id} (view={view}, since={since_ms})")
+            secrets, deleted = sync_changes(user_id, user_groups, since_ms, summary)
+            changed = list(secrets)
+            body = to_columnar(changed) if response_format == 'columnar' else {'secrets': changed}
+            body.update(deleted=deleted, watermark=make_watermark(user_groups, started_ms))
+            print(f"Returning {len(changed)} changed and {len(deleted)} deleted secrets")
+            return format_response(200, body, event=event)
 
-        all_secrets = user_secrets + group_secrets + user_shared_secrets
+        phases = access_phases(user_id, user_groups, SUMMARY_ATTRIBUTES if summary else None)
+        start_index, start_key = decode_cursor(cursor, phases) if cursor else (0, None)
 
-        unique_secrets = {}
-        for secret in all_secrets:
-            key = f"{secret['user_id']}-{secret['site']}-{secret['subdirectory']}"
-            if key not in unique_secrets:
-                unique_secrets[key] = secret
-            else:
-                existing = unique_secrets[key]
-                existing['shared_with']['groups'] = list(set(existing['shared_with']['groups'] + secret['shared_with']['groups']))
-                existing['shared_with']['users'] = list(set(existing['shared_with']['users'] + secret['shared_with']['users']))
+        print(f"Fetching secrets for user: {user_id} (view={view}, limit={limit}, resuming={cursor is not None})")
+
+        page_secrets, next_cursor = collect_page(user_id, phases, start_index, start_key, limit, summary)
+        hydrate_page(page_secrets)
 
-        sorted_secrets = sorted(unique_secrets.values(), key=lambda x: x['site'].lower())
-        print(f"Returning {len(sorted_secrets)} unique secrets")
+        sorted_secrets = list(page_secrets)
+        print(f"Returning {len(sorted_secrets)} unique secrets, more={next_cursor is not None}")
 
-        return format_response(200, {'secrets': sorted_secrets})
+        if response_format == 'columnar':
+            body = {**to_columnar(sorted_secrets), 'next_cursor': next_cursor}
+        else:
+            body = {'secrets': sorted_secrets, 'next_cursor': next_cursor}
+        # The watermark changes with every request, so it is sent as a header
+        # to keep the body, and therefore the ETag, stable. Clients that page
+        # sync from the watermark of the first page, which predates every
+        # row they read.
+        watermark = make_watermark(user_groups, started_ms)
+        return format_cacheable_response(body, event, headers={'X-Sync-Watermark': watermark})
+    except ValidationError as e:
+        return format_response(400, {'message': str(e)})
+    except ResyncRequired as e:
+        return format_response(410, {'message': str(e)})
     except Exception as e:
         print("Error fetching secrets:", str(e))
         return format_response(500, {'message': str(e)})
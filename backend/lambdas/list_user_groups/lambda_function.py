@@ -1,7 +1,6 @@
 import os
-import boto3
 import logging
-from jwtlib import verify_token, format_response, parse_body, get_auth_token
+from jwtlib import get_claims, format_response, parse_body, LazyClient, ValidationError, compile_schema
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,20 +8,22 @@ logger.setLevel(logging.INFO)
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 AWS_REGION = os.environ.get("AWS_REGION")
 
-cognito = boto3.client("cognito-idp", region_name=AWS_REGION)
+cognito = LazyClient("cognito-idp", region_name=AWS_REGION)
+
+validate_body = compile_schema({
+    "username": {"type": str, "max_length": 254},
+    "listAllUsers": {"type": bool},
+}, max_body_length=4 * 1024)
 
 def lambda_handler(event, context):
     logger.info("Lambda triggered")
     logger.debug(f"Event received: {event}")
 
     try:
-        token = get_auth_token(event)
-        logger.info("Token extracted")
-
-        verify_token(token)
+        get_claims(event)
         logger.info("Token verified")
 
-        body = parse_body(event.get("body", "{}"))
+        body = parse_body(event.get("body", "{}"), schema=validate_body)
         username = body.get("username")
         list_all_users = body.get("listAllUsers", False)
 
@@ -83,7 +84,7 @@ def lambda_handler(event, context):
                 if not next_token:
                     break
 
-            return format_response(200, {"users": users})
+            return format_response(200, {"users": users}, event=event)
 
         if not username:
             logger.warning("Username not provided and listAllUsers is false")
@@ -114,8 +115,10 @@ def lambda_handler(event, context):
             if not next_token:
                 break
 
-        return format_response(200, {"groups": groups})
+        return format_response(200, {"groups": groups}, event=event)
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as e:
         logger.exception("Unhandled exception")
         status_code = 401 if "Unauthorized" in str(e) else 500
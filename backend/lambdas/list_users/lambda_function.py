@@ -1,17 +1,14 @@
 import os
-import boto3
-from botocore.exceptions import ClientError
-from jwtlib import verify_token, format_response, get_auth_token
+from jwtlib import get_claims, format_response, format_cacheable_response, LazyClient
 
 USER_POOL_ID = os.environ["USER_POOL_ID"]
 AWS_REGION = os.environ["AWS_REGION"]
 
-cognito = boto3.client("cognito-idp", region_name=AWS_REGION)
+cognito = LazyClient("cognito-idp", region_name=AWS_REGION)
 
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded = verify_token(token)
+        decoded = get_claims(event)
         user_id = decoded["sub"]
 
         params = {
@@ -73,7 +70,7 @@ def lambda_handler(event, context):
 
         formatted_users.sort(key=sort_key)
 
-        return format_response(200, {"users": formatted_users})
+        return format_cacheable_response({"users": formatted_users}, event)
 
     except Exception as error:
         status_code = 401 if "Unauthorized" in str(error) else 500
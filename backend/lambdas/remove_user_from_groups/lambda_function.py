@@ -1,24 +1,26 @@
 import os
-import boto3
-from botocore.exceptions import ClientError
-from jwtlib import get_auth_token, verify_token, parse_body, format_response
+from jwtlib import get_claims, parse_body, format_response, LazyClient, ValidationError, compile_schema, publish_membership_change
 
 USER_POOL_ID = os.environ.get("USER_POOL_ID")
 AWS_REGION = os.environ.get("AWS_REGION")
 
-cognito = boto3.client("cognito-idp", region_name=AWS_REGION)
+cognito = LazyClient("cognito-idp", region_name=AWS_REGION)
+
+validate_body = compile_schema({
+    "username": {"type": str, "required": True, "max_length": 254},
+    "groups": {"type": list, "required": True, "max_items": 100, "items": {"type": str, "max_length": 128}},
+}, max_body_length=16 * 1024)
 
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded_token = verify_token(token)
+        decoded_token = get_claims(event)
         current_user = decoded_token.get("sub")
 
         user_groups = decoded_token.get("cognito:groups", [])
         if "Admin" not in user_groups:
             return format_response(403, {"message": "Forbidden: Only Admin users can perform this action"})
 
-        body = parse_body(event.get("body", "{}"))
+        body = parse_body(event.get("body", "{}"), schema=validate_body)
         username = body.get("username")
         groups = body.get("groups")
 
@@ -32,10 +34,13 @@ def lambda_handler(event, context):
                     Username=username,
                     GroupName=group_name
                 )
-            except ClientError as e:
-                print(f"Failed to remove user from group {group_name}: {e}")
+            except Exception as e:
+                code = getattr(e, "response", {}).get("Error", {}).get("Code")
+                print(f"Failed to remove user from group {group_name} ({code or type(e).__name__}): {e}")
                 raise
 
+        publish_membership_change([username], removed=groups)
+
         requires_session_update = username in {
             current_user,
             decoded_token.get("email"),
@@ -47,6 +52,8 @@ def lambda_handler(event, context):
             "requiresSessionUpdate": requires_session_update
         })
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as error:
         print("Error:", error)
         status_code = 401 if "Unauthorized" in str(error) else 500
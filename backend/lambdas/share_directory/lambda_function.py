@@ -1,21 +1,26 @@
 import os
-import json
-import boto3
 from datetime import datetime
-from botocore.exceptions import ClientError
-from jwtlib import get_auth_token, verify_token, parse_body, format_response
+from jwtlib import get_claims, parse_body, format_response, LazyClient, BatchWriter, ValidationError, compile_schema, SHARED_WITH_SPEC, change_audiences, record_changes, bump_group_revisions, share_attributes, existing_shares
 
-dynamodb = boto3.client("dynamodb")
+dynamodb = LazyClient("dynamodb")
 TABLE_PREFIX = os.environ.get("TABLE_PREFIX", "RunaVault_")
+CHANGES_TABLE = f"{TABLE_PREFIX}changes"
+REVISIONS_TABLE = f"{TABLE_PREFIX}revisions"
+# The sharedWith IDs become key parts of the share rows.
+UNESCAPED_FIELDS = frozenset({"sharedWith"})
+
+validate_body = compile_schema({
+    "subdirectory": {"type": str, "required": True, "max_length": 256},
+    "sharedWith": {**SHARED_WITH_SPEC, "required": True},
+}, max_body_length=64 * 1024)
 
 
 def lambda_handler(event, context):
     try:
-        token = get_auth_token(event)
-        decoded = verify_token(token)
+        decoded = get_claims(event)
         user_id = decoded["sub"]
 
-        body = parse_body(event.get("body", "{}"))
+        body = parse_body(event.get("body", "{}"), skip_fields=UNESCAPED_FIELDS, schema=validate_body)
         subdirectory = body.get("subdirectory")
         shared_with = body.get("sharedWith")
 
@@ -23,14 +28,10 @@ def lambda_handler(event, context):
             return format_response(400, {"message": "Missing subdirectory"})
         effective_sub = "" if subdirectory == "default" else subdirectory
 
-        if not isinstance(shared_with, dict):
-            return format_response(400, {"message": "'sharedWith' must be an object"})
         users = shared_with.get("users") or []
         groups = shared_with.get("groups") or []
         roles = shared_with.get("roles") or {}
 
-        if not (isinstance(users, list) and isinstance(groups, list)):
-            return format_response(400, {"message": "users/groups must be arrays"})
         if not users and not groups:
             return format_response(400, {"message": "At least one user or group required"})
 
@@ -46,7 +47,16 @@ def lambda_handler(event, context):
         if not filtered:
             return format_response(404, {"message": "No secrets in that subdirectory"})
 
+        # Every secret's existing rows are rewritten through one writer, so
+        # the whole directory goes out in as few BatchWriteItem calls as
+        # possible. Rows for new shares are put one by one after that, each
+        # only if it does not exist yet: one that does was written by a
+        # concurrent share since the query above and is left as it is.
+        writer = BatchWriter(dynamodb, f"{TABLE_PREFIX}passwords")
+        new_rows = []
+        changes = []
         updated = []
+        touched_groups = set()
         now = datetime.utcnow().isoformat()
 
         # group by password_id
@@ -62,24 +72,15 @@ def lambda_handler(event, context):
             parts = base["site"]["S"].split("#")
             base_key = "#".join(parts[:-1]) if len(parts) >= 3 else f"{parts[0]}#{pwd}"
 
-            existing_users = {i["shared_with_users"]["S"]
-                              for i in group_items if i.get("shared_with_users", {}).get("S") != "NONE"}
-            existing_groups = {i["shared_with_groups"]["S"]
-                               for i in group_items if i.get("shared_with_groups", {}).get("S") != "NONE"}
+            existing_users, existing_groups = map(set, existing_shares(group_items))
 
             new_users = list(existing_users.union(users))
             new_groups = list(existing_groups.union(groups))
             existing_sites = {i["site"]["S"] for i in group_items}
 
-            # delete old
+            # Rows that are written again below replace their delete.
             for it in group_items:
-                try:
-                    dynamodb.delete_item(
-                        TableName=f"{TABLE_PREFIX}passwords",
-                        Key={"user_id": {"S": user_id}, "site": {"S": it["site"]["S"]}}
-                    )
-                except ClientError as e:
-                    print("Ignore delete error:", e)
+                writer.delete({"user_id": {"S": user_id}, "site": it["site"]})
 
             # prepare base item
             roles_map = {
@@ -105,20 +106,12 @@ def lambda_handler(event, context):
                 itm = {
                     **base_item,
                     "site": {"S": composite_key},
-                    "shared_with_groups": {"S": grp},
-                    "shared_with_users": {"S": usr},
+                    **share_attributes(group=grp, user=usr),
                 }
-                try:
-                    if composite_key in existing_sites:
-                        dynamodb.put_item(TableName=f"{TABLE_PREFIX}passwords", Item=itm)
-                    else:
-                        dynamodb.put_item(TableName=f"{TABLE_PREFIX}passwords",
-                                          Item=itm,
-                                          ConditionExpression="attribute_not_exists(user_id) AND attribute_not_exists(site)")
-                except ClientError as e:
-                    if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
-                        print("Error writing item:", e)
-                        raise
+                if composite_key in existing_sites:
+                    writer.put(itm)
+                else:
+                    new_rows.append(itm)
 
             for g in new_groups:
                 if g == "NONE" and len(new_groups) > 1: continue
@@ -127,6 +120,9 @@ def lambda_handler(event, context):
                 if u == "NONE" and len(new_users) > 1: continue
                 store(f"{base_key}#user:{u}", "NONE", u)
 
+            changes.append((pwd, base_key, change_audiences(user_id, new_users, new_groups)))
+            touched_groups.update(new_groups)
+
             updated.append({
                 "site": parts[0],
                 "subdirectory": base_item["subdirectory"]["S"],
@@ -145,8 +141,24 @@ def lambda_handler(event, context):
                 "version": int(base_item["version"]["N"])
             })
 
+        writer.flush()
+        for itm in new_rows:
+            try:
+                dynamodb.put_item(TableName=f"{TABLE_PREFIX}passwords",
+                                  Item=itm,
+                                  ConditionExpression="attribute_not_exists(user_id) AND attribute_not_exists(site)")
+            except Exception as e:
+                if getattr(e, "response", {}).get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    print("Error writing item:", e)
+                    raise
+        print(f"Rewrote {len(updated)} secrets and added {len(new_rows)} share rows, {writer.units} WCU")
+        for pwd, base_key, audiences in changes:
+            record_changes(dynamodb, CHANGES_TABLE, user_id, pwd, base_key, upserted=audiences)
+        bump_group_revisions(dynamodb, REVISIONS_TABLE, touched_groups)
         return format_response(200, {"message": "Directory shared", "secrets": updated})
 
+    except ValidationError as e:
+        return format_response(400, {"message": str(e)})
     except Exception as ex:
         print("Error:", str(ex))
         code = 401 if "Unauthorized" in str(ex) else 404 if "not found" in str(ex).lower() else 500
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Build the access view from the current contents of the passwords table.
+
+The stream processor only sees writes made after the stream was enabled, so
+run this once after deploying the access table and before switching
+list_secrets over with ``-c use_access_view=true``. Every passwords row is
+fed to the processor as if it had just been inserted; running it again is
+harmless. Uses the AWS credentials and region from the environment.
+
+    $ USER_POOL_ID=us-east-1_XXXX python backend/scripts/backfill_access_view.py
+"""
+import argparse
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR / "lambdas" / "layers" / "pyjwt" / "python"))
+
+
+def load_processor():
+    path = BACKEND_DIR / "lambdas" / "access_view_processor" / "lambda_function.py"
+    spec = importlib.util.spec_from_file_location("access_view_processor", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=100, help="passwords rows per scan page")
+    args = parser.parse_args(argv)
+
+    if not os.environ.get("USER_POOL_ID"):
+        parser.error("USER_POOL_ID must be set")
+    os.environ.setdefault("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION", "us-east-1"))
+
+    processor = load_processor()
+    members = processor.Members()
+    params = {"TableName": processor.PASSWORDS_TABLE, "Limit": args.page_size}
+    rows = writes = 0
+    while True:
+        response = processor.dynamodb.scan(**params)
+        items = response.get("Items", [])
+        records = [{"eventName": "INSERT", "dynamodb": {"NewImage": item}} for item in items]
+        writes += processor.apply_stream_records(records, members)
+        rows += len(items)
+        print(f"{rows} rows, {writes} view writes")
+        if "LastEvaluatedKey" not in response:
+            break
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
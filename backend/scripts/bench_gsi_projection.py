@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Compare write units and storage per secret across GSI projections.
+
+Builds the rows create_secret writes for one secret (one per group and
+user share, with a password blob holding a KMS ciphertext per share, as
+the frontend's encryptPassword produces) and prices them with DynamoDB's
+item-size rules:
+
+- a write costs ceil(size / 1 KB) WCU on the table, plus the same for
+  every GSI the row lands in, computed on the projected entry;
+- storage is the item size plus 100 bytes of overhead, per table item and
+  per index entry;
+- a listing reads the index entries (eventually consistent, 4 KB per
+  0.5 RCU, summed across a page) and, for lean projections, hydrates one
+  row per secret with BatchGetItem (0.5 RCU per 4 KB item).
+
+The layouts compared are the original one (ALL projection, "NONE"
+placeholders in both share attributes), ALL with sparse share
+attributes, and the INCLUDE projection the stack now uses.
+
+    $ python backend/scripts/bench_gsi_projection.py --groups 10
+    $ python backend/scripts/bench_gsi_projection.py --groups 10 --users 3 --notes-bytes 400
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import sys
+import uuid
+from decimal import Decimal
+from pathlib import Path
+
+LAYER_DIR = Path(__file__).resolve().parent.parent / "lambdas" / "layers" / "pyjwt" / "python"
+sys.path.insert(0, str(LAYER_DIR))
+os.environ.setdefault("USER_POOL_ID", "us-east-1_bench")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+
+from jwtlib import share_attributes  # noqa: E402
+
+TABLE_KEYS = ("user_id", "site")
+# Non-key attributes of the INCLUDE projection (RunaVaultStack.INDEX_ATTRIBUTES).
+INDEX_ATTRIBUTES = (
+    "password_id", "username", "subdirectory", "tags", "favorite",
+    "last_modified", "version", "encrypted", "shared_with_roles",
+)
+INDEXES = ("shared_with_groups", "shared_with_users")
+ITEM_OVERHEAD_BYTES = 100
+# KMS ciphertext of a short password: header, encryption context digest,
+# IV and tag around the plaintext.
+KMS_CIPHERTEXT_OVERHEAD = 150
+
+
+def value_size(value):
+    """Size of an attribute value under DynamoDB's rules."""
+    (kind, data), = value.items()
+    if kind == "S":
+        return len(data.encode())
+    if kind == "N":
+        digits = len(Decimal(data).normalize().as_tuple().digits)
+        return 1 + math.ceil(digits / 2)
+    if kind in ("BOOL", "NULL"):
+        return 1
+    if kind == "SS":
+        return sum(len(s.encode()) for s in data)
+    if kind == "M":
+        return 3 + sum(len(k.encode()) + value_size(v) + 1 for k, v in data.items())
+    if kind == "L":
+        return 3 + sum(value_size(v) + 1 for v in data)
+    raise ValueError(f"Unsupported attribute type {kind}")
+
+
+def item_size(item):
+    return sum(len(name.encode()) + value_size(value) for name, value in item.items())
+
+
+def ciphertext(password):
+    return base64.b64encode(os.urandom(KMS_CIPHERTEXT_OVERHEAD + len(password))).decode()
+
+
+def secret_rows(groups, users, notes_bytes, sparse):
+    owner = str(uuid.uuid4())
+    password_id = str(uuid.uuid4())
+    password = "correct-horse-battery"
+    blob = {
+        "encryptedPassword": ciphertext(password),
+        "sharedWith": {
+            "users": [{"userId": user, "encryptedPassword": ciphertext(password)} for user in users],
+            "groups": [{"groupId": group, "encryptedPassword": ciphertext(password)} for group in groups],
+        },
+    }
+    base_key = f"intranet.example.com#{password_id}"
+    base_item = {
+        "user_id": {"S": owner},
+        "username": {"S": "service-account"},
+        "password": {"S": json.dumps(blob)},
+        "encrypted": {"BOOL": True},
+        "shared_with_roles": {"M": {group: {"S": "viewer"} for group in groups}},
+        "subdirectory": {"S": "default"},
+        "last_modified": {"S": "2026-01-01T00:00:00.000000+00:00"},
+        "notes": {"S": "n" * notes_bytes},
+        "tags": {"SS": ["NONE"]},
+        "favorite": {"BOOL": False},
+        "version": {"N": "1"},
+        "password_id": {"S": password_id},
+    }
+    rows = []
+    for group in groups or ["NONE"]:
+        shares = share_attributes(group=group) if sparse else {
+            "shared_with_groups": {"S": group}, "shared_with_users": {"S": "NONE"},
+        }
+        rows.append({**base_item, "site": {"S": f"{base_key}#group:{group}"}, **shares})
+    for user in users or ["NONE"]:
+        shares = share_attributes(user=user) if sparse else {
+            "shared_with_groups": {"S": "NONE"}, "shared_with_users": {"S": user},
+        }
+        rows.append({**base_item, "site": {"S": f"{base_key}#user:{user}"}, **shares})
+    return rows
+
+
+def index_entry(row, index_key, projection):
+    if projection == "ALL":
+        return row
+    names = (*TABLE_KEYS, index_key, *(INDEX_ATTRIBUTES if projection == "INCLUDE" else ()))
+    return {name: row[name] for name in names if name in row}
+
+
+def price(rows, projection):
+    table_bytes = [item_size(row) for row in rows]
+    cost = {
+        "table_wcu": sum(math.ceil(size / 1024) for size in table_bytes),
+        "index_wcu": 0,
+        "table_storage": sum(size + ITEM_OVERHEAD_BYTES for size in table_bytes),
+        "index_storage": 0,
+        "index_entries": 0,
+        "entry_bytes": [],
+    }
+    for index_key in INDEXES:
+        for row in rows:
+            if index_key not in row:
+                continue
+            size = item_size(index_entry(row, index_key, projection))
+            cost["index_wcu"] += math.ceil(size / 1024)
+            cost["index_storage"] += size + ITEM_OVERHEAD_BYTES
+            cost["index_entries"] += 1
+            if index_key == "shared_with_groups" and row[index_key]["S"] != "NONE":
+                cost["entry_bytes"].append(size)
+    cost["row_bytes"] = table_bytes[0]
+    return cost
+
+
+def listing_rcu(cost, projection, secrets, summary):
+    """RCU for one group member listing ``secrets`` secrets shared with the group."""
+    entry = cost["entry_bytes"][0]
+    query = 0.5 * math.ceil(entry * secrets / 4096)
+    hydrate = 0 if summary or projection != "INCLUDE" else 0.5 * math.ceil(cost["row_bytes"] / 4096) * secrets
+    return query + hydrate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=10, help="groups the secret is shared with")
+    parser.add_argument("--users", type=int, default=0, help="users the secret is shared with")
+    parser.add_argument("--notes-bytes", type=int, default=200, help="size of the notes field")
+    parser.add_argument("--page", type=int, default=100, help="secrets per listing page for the read estimate")
+    args = parser.parse_args(argv)
+
+    groups = [f"team-{i:02d}" for i in range(args.groups)]
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    layouts = (
+        ("ALL, NONE placeholders", secret_rows(groups, users, args.notes_bytes, sparse=False), "ALL"),
+        ("ALL, sparse", secret_rows(groups, users, args.notes_bytes, sparse=True), "ALL"),
+        ("INCLUDE, sparse", secret_rows(groups, users, args.notes_bytes, sparse=True), "INCLUDE"),
+    )
+
+    print(f"One secret shared with {args.groups} groups and {args.users} users: "
+          f"{len(layouts[0][1])} rows of ~{item_size(layouts[0][1][0])} bytes\n")
+    header = (f"{'layout':<24} {'entries':>7} {'table WCU':>9} {'index WCU':>9} {'total WCU':>9} "
+              f"{'index KB':>8} {'total KB':>8} {'list RCU':>8} {'summary':>7}")
+    print(header)
+    print("-" * len(header))
+    baseline = None
+    for name, rows, projection in layouts:
+        cost = price(rows, projection)
+        total_wcu = cost["table_wcu"] + cost["index_wcu"]
+        total_storage = cost["table_storage"] + cost["index_storage"]
+        baseline = baseline or (total_wcu, total_storage)
+        print(
+            f"{name:<24} {cost['index_entries']:>7} {cost['table_wcu']:>9} {cost['index_wcu']:>9} {total_wcu:>9} "
+            f"{cost['index_storage'] / 1024:>8.1f} {total_storage / 1024:>8.1f} "
+            f"{listing_rcu(cost, projection, args.page, False):>8.1f} "
+            f"{listing_rcu(cost, projection, args.page, True):>7.1f}"
+        )
+    print(f"\nWCU and KB are per secret write; RCU is for a member listing {args.page} such secrets "
+          f"through the group index (full view, then view=summary).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Compare request parsing with the previous and current sanitizers.
+
+Bodies are modelled on what the frontend sends to create_secret (a KMS
+ciphertext per shared group/user) and share_directory (large user and group
+lists). Both implementations parse the same JSON text; the legacy one is the
+six-replace, recursive-rebuild version that jwtlib used before.
+
+    $ python backend/scripts/bench_sanitize.py --shares 50 --number 2000
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+LAYER_DIR = Path(__file__).resolve().parent.parent / "lambdas" / "layers" / "pyjwt" / "python"
+sys.path.insert(0, str(LAYER_DIR))
+os.environ.setdefault("USER_POOL_ID", "us-east-1_bench")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+
+import jwtlib  # noqa: E402
+
+
+def legacy_sanitize_string(value):
+    if not isinstance(value, str):
+        return value
+    replacements = {
+        "<": "&lt;",
+        ">": "&gt;",
+        '"': "&quot;",
+        "'": "&#39;",
+        "\\": "&#92;",
+        "`": "&#96;",
+    }
+    for old, new in replacements.items():
+        value = value.replace(old, new)
+    return value
+
+
+def legacy_sanitize_object(obj):
+    if obj is None or not isinstance(obj, (dict, list)):
+        return obj
+    if isinstance(obj, list):
+        return [legacy_sanitize_object(item) for item in obj]
+    sanitized = {}
+    for key, value in obj.items():
+        if isinstance(value, str):
+            sanitized[key] = legacy_sanitize_string(value)
+        elif isinstance(value, (dict, list)):
+            sanitized[key] = legacy_sanitize_object(value)
+        else:
+            sanitized[key] = value
+    return sanitized
+
+
+def legacy_parse_body(body):
+    return legacy_sanitize_object(json.loads(body))
+
+
+def ciphertext(size=512):
+    return base64.b64encode(os.urandom(size)).decode("ascii")
+
+
+def create_secret_body(shares):
+    groups = [f"group-{i}" for i in range(shares)]
+    users = [f"{i:08x}-1111-2222-3333-444455556666" for i in range(shares)]
+    return json.dumps({
+        "site": "https://intranet.example.com/login?next=<dashboard>",
+        "username": "o'brien@example.com",
+        "password": {
+            "encryptedPassword": ciphertext(),
+            "sharedWith": {
+                "users": [{"userId": user, "encryptedPassword": ciphertext()} for user in users],
+                "groups": [{"groupId": group, "encryptedPassword": ciphertext()} for group in groups],
+            },
+        },
+        "encrypted": True,
+        "subdirectory": "infra/prod",
+        "notes": "Rotate every 90 days. Ask \"ops\" before changing `root`.",
+        "tags": ["prod", "infra", "vpn"],
+        "sharedWith": {
+            "users": users,
+            "groups": groups,
+            "roles": {group: "viewer" for group in groups},
+        },
+        "favorite": False,
+        "version": 1,
+    })
+
+
+def share_directory_body(shares):
+    groups = [f"group-{i}" for i in range(shares)]
+    return json.dumps({
+        "subdirectory": "infra/prod",
+        "sharedWith": {
+            "users": [f"{i:08x}-1111-2222-3333-444455556666" for i in range(shares * 4)],
+            "groups": groups,
+            "roles": {group: "editor" if i % 3 == 0 else "viewer" for i, group in enumerate(groups)},
+        },
+    })
+
+
+SCENARIOS = {
+    "create_secret": (create_secret_body, frozenset({"password", "sharedWith"})),
+    "share_directory": (share_directory_body, frozenset({"sharedWith"})),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shares", type=int, default=20, help="groups/users each secret is shared with")
+    parser.add_argument("--number", type=int, default=1000, help="parses per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements; the fastest counts")
+    args = parser.parse_args(argv)
+
+    print(f"{'body':<18}{'bytes':>9}{'legacy us':>12}{'current us':>12}{'speedup':>9}")
+    for name, (build_body, skip_fields) in SCENARIOS.items():
+        body = build_body(args.shares)
+        legacy = min(timeit.repeat(lambda: legacy_parse_body(body), number=args.number, repeat=args.repeat))
+        current = min(timeit.repeat(
+            lambda: jwtlib.parse_body(body, skip_fields=skip_fields),
+            number=args.number,
+            repeat=args.repeat,
+        ))
+        legacy_us = legacy / args.number * 1e6
+        current_us = current / args.number * 1e6
+        print(f"{name:<18}{len(body):>9}{legacy_us:>12.1f}{current_us:>12.1f}{legacy_us / current_us:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
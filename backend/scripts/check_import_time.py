@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Report the cold-start import time of every Lambda handler.
+
+Each backend/lambdas/*/lambda_function.py is imported in a fresh interpreter
+with ``python -X importtime`` and the shared layer on the path. The script
+exits non-zero if any handler fails to import or exceeds its budget from
+import_budget.json ("default_ms" plus optional per-handler overrides).
+
+    $ python backend/scripts/check_import_time.py
+    $ python backend/scripts/check_import_time.py --budget-ms 40 list_secrets
+
+The per-handler budgets are the slowest of five runs on Python 3.12 (the
+Lambda runtime) with the layer's requirements installed, plus 25%, rounded
+up to 5 ms; the machine had one vCPU. Re-measure the same way and update
+the handler's entry when a change makes it deliberately heavier or
+lighter. New handlers get default_ms until they have an entry.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+LAMBDAS_DIR = BACKEND_DIR / "lambdas"
+LAYER_DIR = LAMBDAS_DIR / "layers" / "pyjwt" / "python"
+DEFAULT_CONFIG = Path(__file__).resolve().parent / "import_budget.json"
+
+# Dummy values so module-level environment lookups succeed outside Lambda.
+HANDLER_ENV = {
+    "USER_POOL_ID": "us-east-1_importtime",
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
+
+
+def discover_handlers():
+    return sorted(
+        path.parent.name
+        for path in LAMBDAS_DIR.glob("*/lambda_function.py")
+    )
+
+
+def measure_import_us(handler):
+    """Return the cumulative import time of lambda_function in microseconds."""
+    handler_dir = LAMBDAS_DIR / handler
+    python_path = [str(handler_dir), str(LAYER_DIR)]
+    if os.environ.get("PYTHONPATH"):
+        python_path.append(os.environ["PYTHONPATH"])
+    env = {**os.environ, **HANDLER_ENV, "PYTHONPATH": os.pathsep.join(python_path)}
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import lambda_function"],
+        cwd=handler_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = [field.strip() for field in line[len("import time:"):].split("|")]
+        if len(fields) == 3 and fields[2] == "lambda_function":
+            return int(fields[1])
+    raise RuntimeError("lambda_function not found in -X importtime output")
+
+
+def load_budgets(config_path, budget_override):
+    config = json.loads(Path(config_path).read_text()) if Path(config_path).exists() else {}
+    default_ms = budget_override if budget_override is not None else config.get("default_ms", 80)
+    overrides = {} if budget_override is not None else config.get("handlers", {})
+    return default_ms, overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handlers", nargs="*", help="handler directories to check (default: all)")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="budget file (default: %(default)s)")
+    parser.add_argument("--budget-ms", type=float, help="budget applied to every handler, ignoring the config")
+    parser.add_argument("--repeat", type=int, default=3, help="imports per handler; the fastest run counts")
+    args = parser.parse_args(argv)
+
+    default_ms, overrides = load_budgets(args.config, args.budget_ms)
+    handlers = args.handlers or discover_handlers()
+
+    failed = False
+    print(f"{'handler':<26}{'import ms':>11}{'budget ms':>11}  status")
+    for handler in handlers:
+        budget_ms = overrides.get(handler, default_ms)
+        try:
+            # The first run also writes bytecode, so keep the fastest run.
+            elapsed_ms = min(measure_import_us(handler) for _ in range(max(args.repeat, 1))) / 1000
+        except RuntimeError as e:
+            failed = True
+            print(f"{handler:<26}{'-':>11}{budget_ms:>11.1f}  ERROR {e}")
+            continue
+        status = "ok" if elapsed_ms <= budget_ms else "OVER BUDGET"
+        failed = failed or elapsed_ms > budget_ms
+        print(f"{handler:<26}{elapsed_ms:>11.1f}{budget_ms:>11.1f}  {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Remove the "NONE" share placeholders from existing passwords rows.
+
+New rows leave shared_with_groups off user-share rows and shared_with_users
+off group-share rows, so the GSIs on those attributes only index real
+shares. This drops the placeholders from rows written before that, which
+empties the "NONE" partition of both indexes. Each attribute is removed
+with a conditional UpdateItem, so rows rewritten meanwhile are left alone
+and the script can be stopped and run again at any time. Uses the AWS
+credentials and region from the environment.
+
+    $ python backend/scripts/migrate_sparse_shares.py --dry-run
+    $ python backend/scripts/migrate_sparse_shares.py --segments 4
+"""
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lambdas" / "layers" / "pyjwt" / "python"))
+
+from jwtlib import get_client  # noqa: E402
+
+SHARE_ATTRIBUTES = ("shared_with_groups", "shared_with_users")
+
+
+def migrate_segment(client, table_name, segment, segments, dry_run, totals, lock):
+    params = {
+        "TableName": table_name,
+        "FilterExpression": "shared_with_groups = :none OR shared_with_users = :none",
+        "ExpressionAttributeValues": {":none": {"S": "NONE"}},
+        "ProjectionExpression": "user_id, site, shared_with_groups, shared_with_users",
+        "Segment": segment,
+        "TotalSegments": segments,
+    }
+    while True:
+        response = client.scan(**params)
+        for item in response.get("Items", []):
+            for attribute in SHARE_ATTRIBUTES:
+                if item.get(attribute, {}).get("S") != "NONE":
+                    continue
+                if not dry_run:
+                    try:
+                        client.update_item(
+                            TableName=table_name,
+                            Key={"user_id": item["user_id"], "site": item["site"]},
+                            UpdateExpression=f"REMOVE {attribute}",
+                            ConditionExpression=f"{attribute} = :none",
+                            ExpressionAttributeValues={":none": {"S": "NONE"}},
+                        )
+                    except client.exceptions.ConditionalCheckFailedException:
+                        continue
+                with lock:
+                    totals[attribute] += 1
+        with lock:
+            totals["scanned"] += response.get("ScannedCount", 0)
+        if "LastEvaluatedKey" not in response:
+            return
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", default=f"{os.environ.get('TABLE_PREFIX', 'RunaVault_')}passwords")
+    parser.add_argument("--segments", type=int, default=1, help="parallel scan segments")
+    parser.add_argument("--dry-run", action="store_true", help="count placeholders without removing them")
+    args = parser.parse_args(argv)
+
+    client = get_client("dynamodb", max_pool_connections=max(args.segments, 10))
+    totals = {"scanned": 0, **dict.fromkeys(SHARE_ATTRIBUTES, 0)}
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=args.segments) as executor:
+        futures = [
+            executor.submit(migrate_segment, client, args.table, segment, args.segments, args.dry_run, totals, lock)
+            for segment in range(args.segments)
+        ]
+        for future in futures:
+            future.result()
+
+    verb = "would remove" if args.dry_run else "removed"
+    print(
+        f"Scanned {totals['scanned']} rows; {verb} {totals['shared_with_groups']} shared_with_groups "
+        f"and {totals['shared_with_users']} shared_with_users placeholders"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
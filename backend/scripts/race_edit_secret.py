@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Race concurrent edits of one secret through edit_secret.
+
+Runs backend/lambdas/edit_secret offline against an in-memory stand-in for
+DynamoDB that applies TransactWriteItems atomically and evaluates its
+conditions. In every round a number of editors read the same version of a
+secret, each with its own notes and sharing, and then all write at once.
+Exactly one edit must succeed; the others must get a 409 with the winner's
+version, and the stored rows must be the winner's rows, all at the new
+version. Exits 1 if any round ends otherwise.
+
+    $ python backend/scripts/race_edit_secret.py
+    $ python backend/scripts/race_edit_secret.py --editors 8 --rounds 50 --wide 150
+    $ python backend/scripts/race_edit_secret.py --metadata
+
+``--metadata`` keeps the sharing as it is, so every edit changes only the
+notes and updates the rows in place instead of replacing them.
+
+``--unconditional`` drops the write conditions to show what concurrent
+edits did to the rows before.
+"""
+import argparse
+import copy
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR / "lambdas" / "layers" / "pyjwt" / "python"))
+os.environ.setdefault("USER_POOL_ID", "us-east-1_race")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ["TRUST_API_AUTHORIZER"] = "true"
+
+
+def load_handler():
+    path = BACKEND_DIR / "lambdas" / "edit_secret" / "lambda_function.py"
+    spec = importlib.util.spec_from_file_location("edit_secret", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TransactionCanceled(Exception):
+    def __init__(self, reasons):
+        super().__init__("Transaction cancelled")
+        self.response = {
+            "Error": {"Code": "TransactionCanceledException"},
+            "CancellationReasons": reasons,
+        }
+
+
+class LocalDynamoDB:
+    """The subset of the DynamoDB client edit_secret uses.
+
+    Queries on the passwords table return pages of PAGE_SIZE rows. Each
+    editor waits at ``barrier`` after reading its last page, so every
+    editor has read the secret before any of them writes it.
+    """
+
+    KEYS = {"passwords": ("user_id", "site"), "changes": ("audience", "change_key"), "revisions": ("scope", None)}
+    PAGE_SIZE = 25
+
+    def __init__(self, barrier=None):
+        self.tables = {kind: {} for kind in self.KEYS}
+        self.lock = threading.Lock()
+        self.barrier = barrier
+        self.readers = threading.local()
+        self.transactions = 0
+        self.rewrites = 0
+
+    def _table(self, name):
+        kind = name.rsplit("_", 1)[-1]
+        return self.tables[kind], self.KEYS[kind]
+
+    @staticmethod
+    def _key(item, keys):
+        return tuple(item[name]["S"] for name in keys if name)
+
+    @staticmethod
+    def _holds(condition, item, names, values):
+        """Evaluate the condition expressions edit_secret writes."""
+        for clause in (c.strip() for c in condition.split(" AND ")):
+            match = re.fullmatch(r"attribute_(not_)?exists\((\w+)\)", clause)
+            if match:
+                if (match.group(2) in (item or {})) == bool(match.group(1)):
+                    return False
+                continue
+            match = re.fullmatch(r"(#?\w+) = (:\w+)", clause)
+            if not match:
+                raise ValueError(f"Unsupported condition: {clause}")
+            name = (names or {}).get(match.group(1), match.group(1))
+            if item is None or item.get(name) != values[match.group(2)]:
+                return False
+        return True
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, ExclusiveStartKey=None, **_):
+        table, keys = self._table(TableName)
+        user_id = ExpressionAttributeValues[":user_id"]["S"]
+        prefix = ExpressionAttributeValues[":site"]["S"]
+        with self.lock:
+            rows = [copy.deepcopy(row) for key, row in sorted(table.items()) if key[0] == user_id and key[1].startswith(prefix)]
+        if ExclusiveStartKey:
+            start = self._key(ExclusiveStartKey, keys)
+            rows = [row for row in rows if self._key(row, keys) > start]
+        page = rows[:self.PAGE_SIZE]
+        response = {"Items": page}
+        if len(rows) > self.PAGE_SIZE:
+            response["LastEvaluatedKey"] = {name: page[-1][name] for name in keys}
+        elif self.barrier is not None and not getattr(self.readers, "waited", False):
+            self.readers.waited = True
+            self.barrier.wait()
+        return response
+
+    def transact_write_items(self, TransactItems, **_):
+        if len(TransactItems) > 100:
+            raise ValueError("TransactWriteItems accepts at most 100 actions")
+        with self.lock:
+            reasons, failed = [], False
+            for action in TransactItems:
+                (kind, request), = action.items()
+                table, keys = self._table(request["TableName"])
+                current = table.get(self._key(request.get("Item") or request["Key"], keys))
+                condition = request.get("ConditionExpression")
+                if condition and not self._holds(
+                    condition, current, request.get("ExpressionAttributeNames"), request.get("ExpressionAttributeValues")
+                ):
+                    failed = True
+                    reasons.append({"Code": "ConditionalCheckFailed", **({"Item": copy.deepcopy(current)} if current else {})})
+                else:
+                    reasons.append({"Code": "None"})
+            if failed:
+                raise TransactionCanceled(reasons)
+            for action in TransactItems:
+                (kind, request), = action.items()
+                table, keys = self._table(request["TableName"])
+                if kind == "Put":
+                    table[self._key(request["Item"], keys)] = copy.deepcopy(request["Item"])
+                elif kind == "Update":
+                    item = table.setdefault(self._key(request["Key"], keys), copy.deepcopy(request["Key"]))
+                    names, values = request["ExpressionAttributeNames"], request["ExpressionAttributeValues"]
+                    for name, value in re.findall(r"(#\w+) = (:\w+)", request["UpdateExpression"]):
+                        item[names[name]] = copy.deepcopy(values[value])
+                else:
+                    table.pop(self._key(request["Key"], keys), None)
+            self.transactions += 1
+            self.rewrites += any("Update" not in action for action in TransactItems)
+        return {"ConsumedCapacity": [{"CapacityUnits": 2.0 * len(TransactItems)}]}
+
+    def batch_write_item(self, RequestItems, **_):
+        with self.lock:
+            for name, requests in RequestItems.items():
+                table, keys = self._table(name)
+                if len(requests) > 25:
+                    raise ValueError("BatchWriteItem accepts at most 25 requests")
+                for request in requests:
+                    if "PutRequest" in request:
+                        item = request["PutRequest"]["Item"]
+                        table[self._key(item, keys)] = copy.deepcopy(item)
+                    else:
+                        table.pop(self._key(request["DeleteRequest"]["Key"], keys), None)
+        return {"UnprocessedItems": {}, "ConsumedCapacity": [{"CapacityUnits": float(len(requests))}]}
+
+    def update_item(self, TableName, Key, ExpressionAttributeValues, **_):
+        table, keys = self._table(TableName)
+        with self.lock:
+            item = table.setdefault(self._key(Key, keys), copy.deepcopy(Key))
+            revision = int(item.get("revision", {"N": "0"})["N"]) + int(ExpressionAttributeValues[":one"]["N"])
+            item["revision"] = {"N": str(revision)}
+        return {}
+
+
+def seed_secret(dynamodb, owner, users):
+    password_id = str(uuid.uuid4())
+    site = f"intranet.example.com#{password_id}"
+    base = {
+        "user_id": {"S": owner},
+        "username": {"S": "service-account"},
+        "password": {"S": json.dumps({"encryptedPassword": uuid.uuid4().hex})},
+        "encrypted": {"BOOL": True},
+        "shared_with_roles": {"M": {}},
+        "subdirectory": {"S": "default"},
+        "last_modified": {"S": "2026-01-01T00:00:00+00:00"},
+        "notes": {"S": "seed"},
+        "tags": {"SS": ["NONE"]},
+        "favorite": {"BOOL": False},
+        "version": {"N": "1"},
+        "password_id": {"S": password_id},
+    }
+    table, keys = dynamodb._table("RunaVault_passwords")
+    targets = [("group", "NONE")] + [("user", user) for user in users or ["NONE"]]
+    for kind, target in targets:
+        row = {**base, "site": {"S": f"{site}#{kind}:{target}"}}
+        if target != "NONE":
+            row["shared_with_users"] = {"S": target}
+        table[dynamodb._key(row, keys)] = row
+    return site
+
+
+def edit_event(owner, site, notes, users, version):
+    body = {"site": site, "subdirectory": "default", "notes": notes}
+    if users is not None:
+        body["sharedWith"] = {"users": users, "groups": [], "roles": {}}
+    if version is not None:
+        body["version"] = version
+    return {
+        "body": json.dumps(body),
+        "requestContext": {"authorizer": {"jwt": {"claims": {"sub": owner, "cognito:groups": "[]"}}}},
+    }
+
+
+def run_round(handler, editors, wide, send_version, metadata, rng):
+    owner = "owner-sub"
+    dynamodb = LocalDynamoDB(threading.Barrier(editors))
+    handler.dynamodb = dynamodb
+    start_users = [f"user-{i:03d}" for i in range(wide)]
+    site = seed_secret(dynamodb, owner, start_users)
+    # Each editor shares with a different set of users, so mixed rows show.
+    edits = []
+    for editor in range(editors):
+        if metadata:
+            users = None
+        else:
+            users = sorted(rng.sample(start_users, len(start_users) // 2) + [f"editor-{editor}"])
+        edits.append((f"notes from editor {editor}", users))
+
+    def edit(notes_users):
+        notes, users = notes_users
+        response = handler.lambda_handler(edit_event(owner, site, notes, users, 1 if send_version else None), None)
+        return response["statusCode"], json.loads(response["body"])
+
+    # The handler's logs are dropped; redirecting is process-wide, so it
+    # wraps the whole round rather than each thread.
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=editors) as executor:
+        results = list(executor.map(edit, edits))
+
+    problems = []
+    winners = [i for i, (status, _) in enumerate(results) if status == 200]
+    other = sorted({status for status, _ in results if status not in (200, 409)})
+    if other:
+        problems.append(f"unexpected statuses {other}: {[b.get('message') for s, b in results if s in other][:2]}")
+    if len(winners) != 1:
+        problems.append(f"{len(winners)} edits succeeded")
+    for status, body in results:
+        if status == 409 and body.get("current_version") != 2:
+            problems.append(f"409 reported version {body.get('current_version')}, expected 2")
+    rows = [row for key, row in dynamodb.tables["passwords"].items() if key[0] == owner]
+    versions = sorted({row["version"]["N"] for row in rows})
+    notes = sorted({row["notes"]["S"] for row in rows})
+    targets = sorted(row["site"]["S"].rpartition(":")[2] for row in rows if "#user:" in row["site"]["S"])
+    if versions != ["2"]:
+        problems.append(f"rows at versions {versions}")
+    if len(notes) != 1:
+        problems.append(f"rows carry {len(notes)} different notes")
+    if len(winners) == 1:
+        notes_expected, users_expected = edits[winners[0]]
+        if notes != [notes_expected] or targets != (start_users if users_expected is None else users_expected):
+            problems.append("stored rows do not match the successful edit")
+    if metadata and dynamodb.rewrites:
+        problems.append(f"{dynamodb.rewrites} metadata edits rewrote the rows")
+    return problems, dynamodb.transactions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--editors", type=int, default=4, help="concurrent edits per round")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--wide", type=int, default=6, help="users the secret starts out shared with")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--send-version", action="store_true", help="editors send the version they read")
+    parser.add_argument("--metadata", action="store_true", help="edit only the notes, in place")
+    parser.add_argument("--unconditional", action="store_true", help="write without conditions, as before")
+    args = parser.parse_args(argv)
+
+    handler = load_handler()
+    if args.unconditional:
+        handler.unchanged = lambda item: None
+        handler.NEW_ROW = None
+    rng = random.Random(args.seed)
+    failed = 0
+    for round_number in range(args.rounds):
+        problems, transactions = run_round(handler, args.editors, args.wide, args.send_version, args.metadata, rng)
+        if problems:
+            failed += 1
+            print(f"round {round_number}: " + "; ".join(problems))
+    print(f"{args.rounds} rounds of {args.editors} concurrent edits, {args.wide} users shared")
+    if failed:
+        print(f"FAIL: {failed} rounds lost or mixed an edit")
+        return 1
+    print("OK: one edit per round won, the others got 409")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
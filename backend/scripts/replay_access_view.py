@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""Replay passwords-table stream records through the access-view processor.
+
+Runs backend/lambdas/access_view_processor offline against in-memory
+stand-ins for DynamoDB and Cognito, then checks the resulting view against
+the one computed directly from the final table state and group membership.
+
+The input is a JSON document:
+
+    {
+      "groups": {"Developers": ["<sub>", ...]},
+      "usernames": {"jane@example.com": "<sub>"},
+      "events": [<stream record> | {"Records": [...]} | <membership event>]
+    }
+
+Stream records are what the function receives from the DynamoDB event
+source (capture them from a test stack's logs). Membership events are the
+payloads published by add_user_to_groups, remove_user_from_groups and
+delete_group. Without an input file a random workload is generated.
+
+    $ python backend/scripts/replay_access_view.py captured.json
+    $ python backend/scripts/replay_access_view.py --generate 500 --seed 7 --save workload.json
+"""
+import argparse
+import copy
+import importlib.util
+import json
+import os
+import random
+import sys
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR / "lambdas" / "layers" / "pyjwt" / "python"))
+os.environ.setdefault("USER_POOL_ID", "us-east-1_replay")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+
+
+def load_processor():
+    path = BACKEND_DIR / "lambdas" / "access_view_processor" / "lambda_function.py"
+    spec = importlib.util.spec_from_file_location("access_view_processor", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class LocalDynamoDB:
+    """The subset of the DynamoDB client the processor uses."""
+
+    KEYS = {"passwords": ("user_id", "site"), "access": ("recipient", "entry_key")}
+    # Attributes the group GSI carries besides the keys, as in the stack.
+    INDEX_ATTRIBUTES = (
+        "shared_with_groups", "password_id", "username", "subdirectory", "tags", "favorite",
+        "last_modified", "version", "encrypted", "shared_with_roles",
+    )
+
+    def __init__(self):
+        self.tables = {"passwords": {}, "access": {}}
+
+    def _table(self, name):
+        kind = name.rsplit("_", 1)[-1]
+        return self.tables[kind], self.KEYS[kind]
+
+    def apply_record(self, record):
+        table, (pk, sk) = self._table("passwords")
+        images = record["dynamodb"]
+        keys = images.get("Keys") or images.get("NewImage") or images.get("OldImage")
+        key = (keys[pk]["S"], keys[sk]["S"])
+        if images.get("NewImage"):
+            table[key] = copy.deepcopy(images["NewImage"])
+        else:
+            table.pop(key, None)
+
+    def batch_write_item(self, RequestItems, **_):
+        for name, requests in RequestItems.items():
+            table, (pk, sk) = self._table(name)
+            if len(requests) > 25:
+                raise ValueError("BatchWriteItem accepts at most 25 requests")
+            for request in requests:
+                if "PutRequest" in request:
+                    item = request["PutRequest"]["Item"]
+                    table[(item[pk]["S"], item[sk]["S"])] = copy.deepcopy(item)
+                else:
+                    key = request["DeleteRequest"]["Key"]
+                    table.pop((key[pk]["S"], key[sk]["S"]), None)
+        return {"UnprocessedItems": {}}
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for name, request in RequestItems.items():
+            table, (pk, sk) = self._table(name)
+            if len(request["Keys"]) > 100:
+                raise ValueError("BatchGetItem accepts at most 100 keys")
+            keys = [(key[pk]["S"], key[sk]["S"]) for key in request["Keys"]]
+            responses[name] = [copy.deepcopy(table[key]) for key in keys if key in table]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, IndexName=None,
+              ProjectionExpression=None, ExclusiveStartKey=None, **_):
+        table, (pk, sk) = self._table(TableName)
+        values = {name: value["S"] for name, value in ExpressionAttributeValues.items()}
+        if IndexName:
+            rows = [
+                {name: r[name] for name in (pk, sk, *self.INDEX_ATTRIBUTES) if name in r}
+                for r in table.values() if r.get("shared_with_groups", {}).get("S") == values[":group"]
+            ]
+        else:
+            prefix = values.get(":via", "")
+            rows = [
+                r for k, r in sorted(table.items())
+                if k[0] == values[":recipient"] and k[1].startswith(prefix)
+            ]
+        if ProjectionExpression:
+            names = [name.strip() for name in ProjectionExpression.split(",")]
+            rows = [{name: row[name] for name in names if name in row} for row in rows]
+        return {"Items": copy.deepcopy(rows)}
+
+
+class LocalCognito:
+    def __init__(self, groups, usernames):
+        self.groups = {group: list(members) for group, members in groups.items()}
+        self.usernames = dict(usernames)
+
+    def list_users_in_group(self, UserPoolId, GroupName, NextToken=None):
+        if GroupName not in self.groups:
+            error = Exception(f"Group {GroupName} not found")
+            error.response = {"Error": {"Code": "ResourceNotFoundException"}}
+            raise error
+        return {"Users": [
+            {"Username": sub, "Attributes": [{"Name": "sub", "Value": sub}]}
+            for sub in self.groups[GroupName]
+        ]}
+
+    def admin_get_user(self, UserPoolId, Username):
+        sub = self.usernames.get(Username, Username)
+        return {"UserAttributes": [{"Name": "sub", "Value": sub}]}
+
+    def apply_membership(self, event):
+        subs = [self.usernames.get(name, name) for name in event.get("usernames", [])]
+        for group in event.get("added", []):
+            members = self.groups.setdefault(group, [])
+            members.extend(sub for sub in subs if sub not in members)
+        for group in event.get("removed", []):
+            members = self.groups.get(group, [])
+            self.groups[group] = [sub for sub in members if sub not in subs]
+
+
+def expected_view(processor, table, cognito):
+    members = processor.Members()
+    view = {}
+    for row in table.values():
+        for recipient, via in processor.recipients(row, members):
+            entry = processor.access_entry(recipient, via, row)
+            view[(recipient, entry["entry_key"]["S"])] = entry
+    return view
+
+
+def replay(processor, document, batch_size):
+    dynamodb = LocalDynamoDB()
+    cognito = LocalCognito(document.get("groups", {}), document.get("usernames", {}))
+    processor.dynamodb = dynamodb
+    processor.cognito = cognito
+
+    pending = []
+    invocations = 0
+
+    def flush():
+        nonlocal invocations
+        for start in range(0, len(pending), batch_size):
+            processor.lambda_handler({"Records": pending[start:start + batch_size]}, None)
+            invocations += 1
+        pending.clear()
+
+    for event in document.get("events", []):
+        records = event["Records"] if "Records" in event else [event] if "dynamodb" in event else None
+        if records is not None:
+            # DynamoDB has applied the write before the record is delivered.
+            for record in records:
+                dynamodb.apply_record(record)
+            pending.extend(records)
+            continue
+        flush()
+        # Cognito already holds the new membership when the event is published.
+        cognito.apply_membership(event)
+        processor.lambda_handler(event, None)
+        invocations += 1
+    flush()
+    return dynamodb, cognito, invocations
+
+
+def row(owner, site, password_id, group="NONE", user="NONE"):
+    target = f"group:{group}" if group != "NONE" else f"user:{user}"
+    item = {
+        "user_id": {"S": owner},
+        "site": {"S": f"{site}#{password_id}#{target}"},
+        "password_id": {"S": password_id},
+        "username": {"S": "user"},
+        "password": {"S": json.dumps({"encryptedPassword": uuid.uuid4().hex})},
+    }
+    if group != "NONE":
+        item["shared_with_groups"] = {"S": group}
+    if user != "NONE":
+        item["shared_with_users"] = {"S": user}
+    return item
+
+
+def record(name, old=None, new=None):
+    image = new or old
+    images = {"Keys": {"user_id": image["user_id"], "site": image["site"]}}
+    if old:
+        images["OldImage"] = old
+    if new:
+        images["NewImage"] = new
+    return {"eventName": name, "dynamodb": images}
+
+
+def generate(operations, seed):
+    """A random mix of creates, share edits, deletes and membership changes."""
+    rng = random.Random(seed)
+    users = [f"user-{i}" for i in range(6)]
+    groups = {f"group-{i}": rng.sample(users, 2) for i in range(3)}
+    usernames = {f"{sub}@example.com": sub for sub in users}
+    membership = {group: list(members) for group, members in groups.items()}
+    secrets = {}
+    events = []
+
+    def share_rows(owner, site, password_id):
+        share_groups = rng.sample(sorted(membership), rng.randint(0, 2))
+        share_users = rng.sample([u for u in users if u != owner], rng.randint(0, 2))
+        rows = [row(owner, site, password_id, group=g) for g in share_groups or ["NONE"]]
+        rows += [row(owner, site, password_id, user=u) for u in share_users or ["NONE"]]
+        return rows
+
+    for _ in range(operations):
+        action = rng.random()
+        if action < 0.4 or not secrets:
+            owner = rng.choice(users)
+            password_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            rows = share_rows(owner, f"site{rng.randint(0, 99)}.example.com", password_id)
+            secrets[password_id] = rows
+            events.extend(record("INSERT", new=r) for r in rows)
+        elif action < 0.6:
+            password_id = rng.choice(sorted(secrets))
+            old_rows = secrets[password_id]
+            owner = old_rows[0]["user_id"]["S"]
+            site = old_rows[0]["site"]["S"].split("#")[0]
+            new_rows = share_rows(owner, site, password_id)
+            secrets[password_id] = new_rows
+            events.extend(record("REMOVE", old=r) for r in old_rows)
+            events.extend(record("INSERT", new=r) for r in new_rows)
+        elif action < 0.75:
+            password_id = rng.choice(sorted(secrets))
+            events.extend(record("REMOVE", old=r) for r in secrets.pop(password_id))
+        elif action < 0.85:
+            password_id = rng.choice(sorted(secrets))
+            rows = secrets[password_id]
+            index = rng.randrange(len(rows))
+            old = rows[index]
+            new = {**old, "username": {"S": f"user-{rng.randint(0, 9)}"}}
+            rows[index] = new
+            events.append(record("MODIFY", old=old, new=new))
+        else:
+            group = rng.choice(sorted(membership))
+            sub = rng.choice(users)
+            if sub in membership[group]:
+                membership[group].remove(sub)
+                events.append({"type": "membership", "usernames": [f"{sub}@example.com"], "added": [], "removed": [group]})
+            else:
+                membership[group].append(sub)
+                events.append({"type": "membership", "usernames": [f"{sub}@example.com"], "added": [group], "removed": []})
+
+    return {"groups": groups, "usernames": usernames, "events": events}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", nargs="?", help="JSON document with groups, usernames and events")
+    parser.add_argument("--generate", type=int, default=300, help="operations in a generated workload")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the generated workload")
+    parser.add_argument("--save", help="write the generated workload to this file")
+    parser.add_argument("--batch-size", type=int, default=100, help="stream records per invocation")
+    parser.add_argument("--dump", action="store_true", help="print the resulting view per recipient")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        document = json.loads(Path(args.input).read_text())
+    else:
+        document = generate(args.generate, args.seed)
+        if args.save:
+            Path(args.save).write_text(json.dumps(document, indent=1))
+
+    processor = load_processor()
+    dynamodb, cognito, invocations = replay(processor, document, args.batch_size)
+    actual = dynamodb.tables["access"]
+    expected = expected_view(processor, dynamodb.tables["passwords"], cognito)
+
+    if args.dump:
+        for recipient, key in sorted(actual):
+            print(f"{recipient:<40} {key}")
+
+    missing = sorted(set(expected) - set(actual))
+    extra = sorted(set(actual) - set(expected))
+    stale = sorted(key for key in set(expected) & set(actual) if expected[key] != actual[key])
+    print(f"{len(document.get('events', []))} events, {invocations} invocations, "
+          f"{len(dynamodb.tables['passwords'])} rows, {len(actual)} view entries")
+    for label, keys in (("missing", missing), ("unexpected", extra), ("stale", stale)):
+        for recipient, key in keys[:20]:
+            print(f"{label}: {recipient} {key}")
+    if missing or extra or stale:
+        print(f"FAIL: {len(missing)} missing, {len(extra)} unexpected, {len(stale)} stale")
+        return 1
+    print("OK: view matches the table")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
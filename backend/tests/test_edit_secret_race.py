@@ -0,0 +1,107 @@
+"""Concurrent edits of one secret through edit_secret.
+
+Runs the rounds of backend/scripts/race_edit_secret.py: several editors
+read the same version of a secret and write at once, and exactly one of
+them may succeed while the others get a 409.
+
+    $ python -m pytest backend/tests
+"""
+import copy
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import race_edit_secret  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def handler():
+    return race_edit_secret.load_handler()
+
+
+@pytest.mark.parametrize("metadata", [False, True], ids=["rewrite", "metadata"])
+@pytest.mark.parametrize("send_version", [False, True], ids=["read-version", "sent-version"])
+def test_one_concurrent_edit_wins(handler, metadata, send_version):
+    rng = random.Random(1)
+    for _ in range(10):
+        problems, _ = race_edit_secret.run_round(handler, 4, 6, send_version, metadata, rng)
+        assert problems == []
+
+
+def test_wide_share_conflicts_cleanly(handler):
+    # 150 users shared means the rows are rewritten in two transactions.
+    problems, _ = race_edit_secret.run_round(handler, 4, 150, False, False, random.Random(1))
+    assert problems == []
+
+
+class InterruptedDynamoDB(race_edit_secret.LocalDynamoDB):
+    """Bumps the version of every row the first transaction left alone,
+    as if another edit landed between the transactions of a wide edit."""
+
+    def transact_write_items(self, TransactItems, **kwargs):
+        response = super().transact_write_items(TransactItems, **kwargs)
+        if self.transactions == 1:
+            with self.lock:
+                for row in self.tables["passwords"].values():
+                    if row["version"]["N"] == "1":
+                        row["version"] = {"N": "7"}
+        return response
+
+
+def test_conflict_after_a_committed_transaction_is_reported_as_partial(handler):
+    dynamodb = InterruptedDynamoDB()
+    handler.dynamodb = dynamodb
+    users = [f"user-{i:03d}" for i in range(150)]
+    site = race_edit_secret.seed_secret(dynamodb, "owner-sub", users)
+    before = copy.deepcopy(dynamodb.tables["passwords"])
+
+    response = handler.lambda_handler(race_edit_secret.edit_event("owner-sub", site, "edited", users[:75], None), None)
+
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 409
+    assert body["partial"] is True
+    assert body["current_version"] == 7
+    assert dynamodb.transactions == 1
+    assert dynamodb.tables["passwords"] != before
+
+
+def test_metadata_edit_of_legacy_rows_updates_in_place(handler):
+    dynamodb = race_edit_secret.LocalDynamoDB()
+    handler.dynamodb = dynamodb
+    site = race_edit_secret.seed_secret(dynamodb, "owner-sub", ["user-000"])
+    for row in dynamodb.tables["passwords"].values():
+        del row["shared_with_roles"], row["subdirectory"]
+
+    response = handler.lambda_handler(race_edit_secret.edit_event("owner-sub", site, "edited", None, None), None)
+
+    assert response["statusCode"] == 200
+    assert dynamodb.transactions == 1
+    assert dynamodb.rewrites == 0
+    rows = list(dynamodb.tables["passwords"].values())
+    assert {row["notes"]["S"] for row in rows} == {"edited"}
+    assert {row["version"]["N"] for row in rows} == {"2"}
+
+
+def test_metadata_edit_is_all_or_nothing(handler):
+    dynamodb = race_edit_secret.LocalDynamoDB()
+    handler.dynamodb = dynamodb
+    site = race_edit_secret.seed_secret(dynamodb, "owner-sub", ["user-000", "user-001"])
+    # Reads see version 1 everywhere, but one row has moved on.
+    read = dynamodb.query
+    dynamodb.query = lambda **kwargs: {**read(**kwargs), "Items": [
+        {**row, "version": {"N": "1"}} for row in read(**kwargs)["Items"]
+    ]}
+    last = max(dynamodb.tables["passwords"])
+    dynamodb.tables["passwords"][last]["version"] = {"N": "3"}
+    before = copy.deepcopy(dynamodb.tables["passwords"])
+
+    response = handler.lambda_handler(race_edit_secret.edit_event("owner-sub", site, "edited", None, None), None)
+
+    assert response["statusCode"] == 409
+    assert json.loads(response["body"])["current_version"] == 3
+    assert dynamodb.tables["passwords"] == before
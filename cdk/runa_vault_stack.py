@@ -3,6 +3,7 @@ from aws_cdk import (
     aws_cognito as cognito,
     aws_dynamodb as dynamodb,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_apigatewayv2 as apigw,
     aws_apigatewayv2_integrations as apigw_integrations,
     aws_kms as kms,
@@ -17,6 +18,28 @@ from aws_cdk import (
 from constructs import Construct
 
 class RunaVaultStack(Stack):
+    # Layer bundling, precompiled bytecode and the functions must all agree on
+    # this runtime and architecture, otherwise the .pyc files are ignored.
+    PYTHON_RUNTIME = lambda_.Runtime.PYTHON_3_12
+    ARCHITECTURE = lambda_.Architecture.ARM_64
+    # Non-key attributes projected into the lean share GSIs: what the vault
+    # list shows (list_secrets SUMMARY_ATTRIBUTES, less the keys).
+    INDEX_ATTRIBUTES = [
+        "password_id", "username", "subdirectory", "tags", "favorite",
+        "last_modified", "version", "encrypted", "shared_with_roles",
+    ]
+    # GSIs of the passwords table: name -> (partition key, sort key, projection).
+    PASSWORDS_INDEXES = {
+        "shared_with_groups-index": ("shared_with_groups", None, dynamodb.ProjectionType.ALL),
+        "shared_with_users-index": ("shared_with_users", None, dynamodb.ProjectionType.ALL),
+        "shared_with_groups-lean-index": ("shared_with_groups", None, dynamodb.ProjectionType.INCLUDE),
+        "shared_with_users-lean-index": ("shared_with_users", None, dynamodb.ProjectionType.INCLUDE),
+        "password_id-index": ("password_id", "user_id", dynamodb.ProjectionType.KEYS_ONLY),
+    }
+    DEFAULT_PASSWORDS_INDEXES = (
+        "shared_with_groups-lean-index", "shared_with_users-lean-index", "password_id-index",
+    )
+
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
@@ -149,28 +172,97 @@ class RunaVaultStack(Stack):
             encryption=dynamodb.TableEncryption.AWS_MANAGED,
             point_in_time_recovery_specification=dynamodb.PointInTimeRecoverySpecification(
                 point_in_time_recovery_enabled=True
+            ),
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES
+        )
+
+        # Indexes on the passwords table. The share GSIs were first created
+        # with an ALL projection; their "-lean" successors carry only the
+        # list-view attributes, and readers fetch the password blob and
+        # notes from the table by key. A GSI's projection cannot be changed
+        # in place and CloudFormation adds or removes at most one GSI per
+        # update, so stacks created before the lean indexes step through
+        # `-c passwords_indexes=<comma-separated names>` (see the README).
+        # Readers use the lean index of a share attribute once it exists.
+        index_names = self.node.try_get_context("passwords_indexes")
+        self.passwords_indexes = (
+            [name for name in str(index_names).split(",") if name] if index_names
+            else list(self.DEFAULT_PASSWORDS_INDEXES)
+        )
+        for index_name in self.passwords_indexes:
+            partition_key, sort_key, projection = self.PASSWORDS_INDEXES[index_name]
+            self.passwords_table.add_global_secondary_index(
+                index_name=index_name,
+                partition_key=dynamodb.Attribute(
+                    name=partition_key,
+                    type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name=sort_key,
+                    type=dynamodb.AttributeType.STRING
+                ) if sort_key else None,
+                projection_type=projection,
+                non_key_attributes=self.INDEX_ATTRIBUTES if projection == dynamodb.ProjectionType.INCLUDE else None
             )
+
+        # Change log behind list_secrets?since=: one entry per secret change
+        # and per audience (owner:, group: or user:), sorted by modification
+        # time. Entries expire through TTL after CHANGE_RETENTION_DAYS.
+        self.changes_table = dynamodb.Table(
+            self, "RunaVaultChanges",
+            table_name="RunaVault_changes",
+            partition_key=dynamodb.Attribute(
+                name="audience",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="change_key",
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute="expires_at",
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED
         )
 
-        # Add Global Secondary Indexes
-        self.passwords_table.add_global_secondary_index(
-            index_name="shared_with_groups-index",
+        # Access view maintained from the passwords table stream: a copy of
+        # every row under each user who can see it, so list_secrets can read
+        # a user's vault with one query.
+        self.access_table = dynamodb.Table(
+            self, "RunaVaultAccess",
+            table_name="RunaVault_access",
             partition_key=dynamodb.Attribute(
-                name="shared_with_groups",
+                name="recipient",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="entry_key",
                 type=dynamodb.AttributeType.STRING
             ),
-            projection_type=dynamodb.ProjectionType.ALL
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED
         )
 
-        self.passwords_table.add_global_secondary_index(
-            index_name="shared_with_users-index",
+        # One revision counter per group ("group:{name}"), bumped by the
+        # writers, so list_secrets can tell whether its cached copy of a
+        # group's share rows is still current.
+        self.revisions_table = dynamodb.Table(
+            self, "RunaVaultRevisions",
+            table_name="RunaVault_revisions",
             partition_key=dynamodb.Attribute(
-                name="shared_with_users",
+                name="scope",
                 type=dynamodb.AttributeType.STRING
             ),
-            projection_type=dynamodb.ProjectionType.ALL
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.AWS_MANAGED
         )
 
+    def share_index(self, attribute):
+        """Name of the deployed GSI on a share attribute, lean if available."""
+        for index_name in (f"{attribute}-lean-index", f"{attribute}-index"):
+            if index_name in self.passwords_indexes:
+                return index_name
+        raise ValueError(f"No index on {attribute} in passwords_indexes")
+
     def create_kms(self):
         # Create KMS key for encryption
         self.kms_key = kms.Key(
@@ -179,92 +271,178 @@ class RunaVaultStack(Stack):
             description="KMS key for RunaVault encryption"
         )
 
+    def python_bundling(self, asset_name, install_requirements=False):
+        """Docker bundling options for layer and handler assets.
+
+        Sources are copied (and requirements installed for the layer) with the
+        function runtime's own image, tests, typing stubs and packaging
+        metadata are stripped, and every module is compiled to bytecode with
+        the unchecked-hash invalidation mode so cold starts load the .pyc
+        files as-is. A size and file-count report is printed for each asset.
+        """
+        output_dir = "/asset-output/python" if install_requirements else "/asset-output"
+        commands = []
+        if install_requirements:
+            commands += [
+                f"pip install --no-cache-dir --no-compile -r requirements.txt -t {output_dir}",
+                "cp -r python /asset-output/",
+                f"rm -rf {output_dir}/bin",
+            ]
+        else:
+            commands.append("cp -r /asset-input/. /asset-output/")
+        commands += [
+            f"find {output_dir} -depth -type d \\( -name '*.dist-info' -o -name '*.egg-info' "
+            "-o -name tests -o -name test -o -name __pycache__ \\) -exec rm -rf {} +",
+            f"find {output_dir} -type f \\( -name '*.pyi' -o -name '*.pyx' -o -name '*.c' -o -name '*.h' \\) -delete",
+            f"python -m compileall -q -j 0 --invalidation-mode unchecked-hash {output_dir}",
+            f"echo \"{asset_name}: $(du -sh /asset-output | cut -f1) in $(find /asset-output -type f | wc -l) files\"",
+        ]
+        return {
+            "image": self.PYTHON_RUNTIME.bundling_image,
+            "platform": self.ARCHITECTURE.docker_platform,
+            "command": ["bash", "-c", " && ".join(commands)],
+        }
+
+    def handler_code(self, lambda_name):
+        return lambda_.Code.from_asset(
+            f"../backend/lambdas/{lambda_name}",
+            bundling=self.python_bundling(lambda_name)
+        )
+
     def create_lambda_layer(self):
         self.pyjwt_layer = lambda_.LayerVersion(
             self, "PyJWTLayer",
             code=lambda_.Code.from_asset(
                 "../backend/lambdas/layers/pyjwt",
-                bundling={
-                    "image": lambda_.Runtime.PYTHON_3_9.bundling_image,
-                    "platform": "linux/arm64",
-                    "command": [
-                        "bash", "-c",
-                        "pip install -r requirements.txt -t /asset-output/python && "
-                        "cp -r python /asset-output/ && "
-                        "find /asset-output -name '*.dist-info' -exec rm -rf {} + && "
-                        "find /asset-output -name '__pycache__' -exec rm -rf {} +"
-                    ]
-                }
+                bundling=self.python_bundling("pyjwt layer", install_requirements=True)
             ),
-            compatible_runtimes=[lambda_.Runtime.PYTHON_3_12],
-            compatible_architectures=[lambda_.Architecture.ARM_64],
+            compatible_runtimes=[self.PYTHON_RUNTIME],
+            compatible_architectures=[self.ARCHITECTURE],
             description="Layer containing PyJWT for token verification"
         )
 
     def create_lambda_functions(self):
+        # Opt in with `cdk deploy -c trust_api_authorizer=true` to let handlers
+        # read the claims already validated by the HTTP API JWT authorizer.
+        trust_api_authorizer = str(self.node.try_get_context("trust_api_authorizer") or "false").lower() == "true"
         common_lambda_config = {
-            "runtime": lambda_.Runtime.PYTHON_3_12,
+            "runtime": self.PYTHON_RUNTIME,
             "environment": {
                 "USER_POOL_ID": self.user_pool.user_pool_id,
-                "CLIENT_ID": self.user_pool_client.user_pool_client_id
+                "CLIENT_ID": self.user_pool_client.user_pool_client_id,
+                "TRUST_API_AUTHORIZER": "true" if trust_api_authorizer else "false",
+                "GROUPS_INDEX": self.share_index("shared_with_groups"),
+                "USERS_INDEX": self.share_index("shared_with_users")
             },
             "layers": [self.pyjwt_layer],
             "timeout": Duration.seconds(30),
-            "architecture": lambda_.Architecture.ARM_64
+            "architecture": self.ARCHITECTURE
         }
 
         self.lambda_functions = {}
 
+        # The access-view processor always runs; list_secrets only reads the
+        # view once it has been backfilled and the stack is deployed with
+        # `-c use_access_view=true`.
+        use_access_view = str(self.node.try_get_context("use_access_view") or "false").lower() == "true"
+        access_view_processor_fn = lambda_.Function(
+            self, "RunaVaultAccessviewprocessorLambda",
+            code=self.handler_code("access_view_processor"),
+            handler="lambda_function.lambda_handler",
+            **{**common_lambda_config, "timeout": Duration.minutes(5)}
+        )
+        access_view_processor_fn.add_event_source(
+            lambda_event_sources.DynamoEventSource(
+                self.passwords_table,
+                starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                batch_size=100,
+                bisect_batch_on_error=True,
+                retry_attempts=10
+            )
+        )
+        access_view_processor_fn.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["cognito-idp:ListUsersInGroup", "cognito-idp:AdminGetUser"],
+                resources=[self.user_pool.user_pool_arn]
+            )
+        )
+        self.passwords_table.grant_read_data(access_view_processor_fn)
+        self.access_table.grant_read_write_data(access_view_processor_fn)
+        self.access_view_processor = access_view_processor_fn
+
         secret_lambdas = [
             "create_secret", "delete_secret", "edit_secret",
-            "get_secret", "list_secrets", "share_directory"
+            "get_secret", "get_secrets", "list_secrets", "share_directory"
         ]
 
         for lambda_name in secret_lambdas:
             if lambda_name == "list_secrets":
                 list_secrets_fn = lambda_.Function(
                     self, "RunaVaultListsecretsLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/list_secrets"),
+                    code=self.handler_code("list_secrets"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
                 
                 list_secrets_fn.add_to_role_policy(
                     iam.PolicyStatement(
-                        actions=["dynamodb:Query", "dynamodb:GetItem"],
+                        actions=["dynamodb:Query", "dynamodb:GetItem", "dynamodb:BatchGetItem"],
                         resources=[
                             self.passwords_table.table_arn,
-                            f"{self.passwords_table.table_arn}/index/shared_with_groups-index",
-                            f"{self.passwords_table.table_arn}/index/shared_with_users-index"
+                            f"{self.passwords_table.table_arn}/index/*",
+                            self.changes_table.table_arn,
+                            self.access_table.table_arn
                         ]
                     )
                 )
+                self.revisions_table.grant_read_data(list_secrets_fn)
+                list_secrets_fn.add_environment("USE_ACCESS_VIEW", "true" if use_access_view else "false")
                 
                 self.lambda_functions[lambda_name] = list_secrets_fn
             elif lambda_name == "create_secret":
                 create_secret_fn = lambda_.Function(
                     self, "RunaVaultCreatesecretLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/create_secret"),
+                    code=self.handler_code("create_secret"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
                 create_secret_fn.add_to_role_policy(
                     iam.PolicyStatement(
-                        actions=["dynamodb:PutItem", "dynamodb:GetItem"],
+                        actions=["dynamodb:BatchWriteItem"],
                         resources=[self.passwords_table.table_arn]
                     )
                 )
+                self.changes_table.grant_write_data(create_secret_fn)
+                self.revisions_table.grant_write_data(create_secret_fn)
                 self.lambda_functions[lambda_name] = create_secret_fn
+            elif lambda_name == "get_secrets":
+                get_secrets_fn = lambda_.Function(
+                    self, "RunaVaultGetsecretsLambda",
+                    code=self.handler_code("get_secrets"),
+                    handler="lambda_function.lambda_handler",
+                    **common_lambda_config
+                )
+                get_secrets_fn.add_to_role_policy(
+                    iam.PolicyStatement(
+                        actions=["dynamodb:Query", "dynamodb:BatchGetItem"],
+                        resources=[
+                            self.passwords_table.table_arn,
+                            f"{self.passwords_table.table_arn}/index/password_id-index"
+                        ]
+                    )
+                )
+                self.lambda_functions[lambda_name] = get_secrets_fn
             else:
                 self.lambda_functions[lambda_name] = lambda_.Function(
                     self, f"RunaVault{lambda_name.capitalize().replace('_', '')}Lambda",
-                    code=lambda_.Code.from_asset(
-                        f"../backend/lambdas/{lambda_name}"
-                    ),
+                    code=self.handler_code(lambda_name),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
                 self.passwords_table.grant_read_write_data(self.lambda_functions[lambda_name])
+                if lambda_name in ("delete_secret", "edit_secret", "share_directory"):
+                    self.changes_table.grant_write_data(self.lambda_functions[lambda_name])
+                    self.revisions_table.grant_write_data(self.lambda_functions[lambda_name])
 
         user_lambdas = [
             "list_users", "create_user", "edit_users",
@@ -276,7 +454,7 @@ class RunaVaultStack(Stack):
             if lambda_name == "list_users":
                 list_users_fn = lambda_.Function(
                     self, "RunaVaultListusersLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/list_users"),
+                    code=self.handler_code("list_users"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -290,7 +468,7 @@ class RunaVaultStack(Stack):
             elif lambda_name == "list_groups":
                 list_groups_fn = lambda_.Function(
                     self, "RunaVaultListgroupsLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/list_groups"),
+                    code=self.handler_code("list_groups"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -304,7 +482,7 @@ class RunaVaultStack(Stack):
             elif lambda_name == "list_user_groups":
                 list_user_groups_fn = lambda_.Function(
                     self, "RunaVaultListusergroupsLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/list_user_groups"),
+                    code=self.handler_code("list_user_groups"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -318,7 +496,7 @@ class RunaVaultStack(Stack):
             elif lambda_name == "create_user":
                 create_user_fn = lambda_.Function(
                     self, "RunaVaultCreateuserLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/create_user"),
+                    code=self.handler_code("create_user"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -332,7 +510,7 @@ class RunaVaultStack(Stack):
             elif lambda_name == "create_group":
                 create_group_fn = lambda_.Function(
                     self, "RunaVaultCreategroupLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/create_group"),
+                    code=self.handler_code("create_group"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -346,7 +524,7 @@ class RunaVaultStack(Stack):
             elif lambda_name == "edit_users":
                 edit_users_fn = lambda_.Function(
                     self, "RunaVaultEditusersLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/edit_users"),
+                    code=self.handler_code("edit_users"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -364,13 +542,13 @@ class RunaVaultStack(Stack):
             elif lambda_name == "delete_group":
                 delete_group_fn = lambda_.Function(
                     self, "RunaVaultDeletegroupLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/delete_group"),
+                    code=self.handler_code("delete_group"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
                 delete_group_fn.add_to_role_policy(
                     iam.PolicyStatement(
-                        actions=["cognito-idp:DeleteGroup"],
+                        actions=["cognito-idp:DeleteGroup", "cognito-idp:ListUsersInGroup"],
                         resources=[self.user_pool.user_pool_arn]
                     )
                 )
@@ -378,7 +556,7 @@ class RunaVaultStack(Stack):
             elif lambda_name == "add_user_to_groups":
                 add_user_to_groups_fn = lambda_.Function(
                     self, "RunaVaultAddusertogroupsLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/add_user_to_groups"),
+                    code=self.handler_code("add_user_to_groups"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -392,7 +570,7 @@ class RunaVaultStack(Stack):
             elif lambda_name == "remove_user_from_groups":
                 remove_user_from_groups_fn = lambda_.Function(
                     self, "RunaVaultRemoveuserfromgroupsLambda",
-                    code=lambda_.Code.from_asset("../backend/lambdas/remove_user_from_groups"),
+                    code=self.handler_code("remove_user_from_groups"),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
@@ -406,14 +584,19 @@ class RunaVaultStack(Stack):
             else:
                 self.lambda_functions[lambda_name] = lambda_.Function(
                     self, f"RunaVault{lambda_name.capitalize().replace('_', '')}Lambda",
-                    code=lambda_.Code.from_asset(
-                        f"../backend/lambdas/{lambda_name}"
-                    ),
+                    code=self.handler_code(lambda_name),
                     handler="lambda_function.lambda_handler",
                     **common_lambda_config
                 )
                 self.passwords_table.grant_read_write_data(self.lambda_functions[lambda_name])
             
+            # Membership changes are forwarded to the access-view processor.
+            if lambda_name in ("add_user_to_groups", "remove_user_from_groups", "delete_group"):
+                self.lambda_functions[lambda_name].add_environment(
+                    "ACCESS_VIEW_FUNCTION", access_view_processor_fn.function_name
+                )
+                access_view_processor_fn.grant_invoke(self.lambda_functions[lambda_name])
+
             # Add Cognito permissions for list_users
             if lambda_name == "list_users":
                 self.lambda_functions[lambda_name].add_to_role_policy(
@@ -437,7 +620,8 @@ class RunaVaultStack(Stack):
             cors_configuration={
                 "allowOrigins": ["*"],
                 "allowMethods": ["OPTIONS", "GET", "POST"],
-                "allowHeaders": ["Content-Type", "Authorization"]
+                "allowHeaders": ["Content-Type", "Authorization", "If-None-Match"],
+                "exposeHeaders": ["ETag", "X-Sync-Watermark"]
             }
         )
         default_stage = apigwv2.CfnStage(
@@ -500,6 +684,7 @@ class RunaVaultStack(Stack):
         add_route_with_options("GET", "/list_secrets", "list_secrets")
         add_route_with_options("POST", "/create_secret", "create_secret")
         add_route_with_options("GET", "/get_secret", "get_secret")
+        add_route_with_options("POST", "/get_secrets", "get_secrets")
         add_route_with_options("POST", "/edit_secret", "edit_secret")
         add_route_with_options("POST", "/delete_secret", "delete_secret")
         add_route_with_options("GET", "/list_users", "list_users")
@@ -1,4 +1,5 @@
-import React, { createContext, useContext, useState, useCallback } from 'react';
+import React, { createContext, useContext, useState, useCallback, useRef } from 'react';
+import { expandSecretsPage } from './ColumnarUtils';
 
 const AppContext = createContext();
 
@@ -8,6 +9,7 @@ export const AppProvider = ({ children }) => {
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
   const [lastFetchTime, setLastFetchTime] = useState({ users: 0, secrets: 0 });
+  const syncWatermark = useRef(null);
 
   const fetchUsers = useCallback(async (accessToken) => {
     const now = Date.now();
@@ -39,15 +41,71 @@ export const AppProvider = ({ children }) => {
     if (secrets !== null && (now - lastFetchTime.secrets) < 300000) {
       return secrets;
     }
-    
+
+    const endpoint = `${process.env.REACT_APP_API_GATEWAY_ENDPOINT}/list_secrets`;
+    const headers = { Authorization: `Bearer ${accessToken}` };
+    const secretKey = (secret) => `${secret.user_id}#${secret.password_id}`;
+
+    // After the first full listing only the changes since the last
+    // watermark are fetched and applied to the local copy.
+    const syncChanges = async () => {
+      const response = await fetch(
+        `${endpoint}?format=columnar&since=${encodeURIComponent(syncWatermark.current)}`,
+        { method: "GET", headers }
+      );
+      if (response.status === 410) return null;
+      if (!response.ok) throw new Error("Failed to fetch secrets");
+      const delta = await response.json();
+      const merged = new Map(secrets.secrets.map(secret => [secretKey(secret), secret]));
+      for (const removed of delta.deleted || []) {
+        merged.delete(secretKey(removed));
+      }
+      for (const secret of expandSecretsPage(delta)) {
+        merged.set(secretKey(secret), secret);
+      }
+      syncWatermark.current = delta.watermark;
+      return { secrets: [...merged.values()] };
+    };
+
+    const listAll = async () => {
+      // A secret shared through several groups can appear on more than one
+      // page; merge its shares into a single entry.
+      const merged = new Map();
+      let cursor = null;
+      let watermark = null;
+      do {
+        const query = `?format=columnar${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""}`;
+        const response = await fetch(`${endpoint}${query}`, { method: "GET", headers });
+        if (!response.ok) throw new Error("Failed to fetch secrets");
+        // Changes made while paging are picked up from the first page's watermark.
+        watermark = watermark || response.headers.get("X-Sync-Watermark");
+        const page = await response.json();
+        for (const secret of expandSecretsPage(page)) {
+          const key = secretKey(secret);
+          const existing = merged.get(key);
+          if (!existing) {
+            merged.set(key, secret);
+            continue;
+          }
+          existing.shared_with.users = [...new Set([...existing.shared_with.users, ...secret.shared_with.users])];
+          existing.shared_with.groups = [...new Set([...existing.shared_with.groups, ...secret.shared_with.groups])];
+          existing.shared_with.roles = { ...existing.shared_with.roles, ...secret.shared_with.roles };
+        }
+        cursor = page.next_cursor;
+      } while (cursor);
+      syncWatermark.current = watermark;
+      return { secrets: [...merged.values()] };
+    };
+
     try {
       setIsLoading(true);
-      const response = await fetch(`${process.env.REACT_APP_API_GATEWAY_ENDPOINT}/list_secrets`, {
-        method: "GET",
-        headers: { Authorization: `Bearer ${accessToken}` },
-      });
-      if (!response.ok) throw new Error("Failed to fetch secrets");
-      const data = await response.json();
+      let data = null;
+      if (secrets !== null && syncWatermark.current) {
+        data = await syncChanges();
+      }
+      if (data === null) {
+        data = await listAll();
+      }
       setSecrets(data);
       setLastFetchTime(prev => ({ ...prev, secrets: now }));
       return data;
@@ -67,6 +125,7 @@ export const AppProvider = ({ children }) => {
   const resetState = useCallback(() => {
     setUsers([]);
     setSecrets(null);
+    syncWatermark.current = null;
     setError(null);
     setLastFetchTime({ users: 0, secrets: 0 });
   }, []);
@@ -0,0 +1,58 @@
+// Expands a list_secrets page sent with format=columnar back into the
+// secret objects the rest of the app works with. Pages in the regular
+// format are returned as they are.
+
+const decoders = {
+  value: (value) => value,
+  ref: (index, strings) => strings[index],
+  refs: (indexes, strings) => indexes.map(index => strings[index]),
+  ref_map: (indexes, strings) => {
+    const mapping = {};
+    for (let i = 0; i < indexes.length; i += 2) {
+      mapping[strings[indexes[i]]] = strings[indexes[i + 1]];
+    }
+    return mapping;
+  },
+};
+
+const setPath = (target, path, value) => {
+  const parts = path.split('.');
+  let node = target;
+  for (const part of parts.slice(0, -1)) {
+    node = node[part] = node[part] || {};
+  }
+  node[parts[parts.length - 1]] = value;
+};
+
+const copyDefault = (value) => (
+  Array.isArray(value) ? [...value] : value && typeof value === 'object' ? { ...value } : value
+);
+
+export const expandSecretsPage = (page) => {
+  if (page.format !== 'columnar') {
+    return page.secrets || [];
+  }
+
+  const { count, strings, defaults = {}, columns = {} } = page;
+  const secrets = Array.from({ length: count }, () => ({}));
+
+  for (const [name, defaultValue] of Object.entries(defaults)) {
+    if (!columns[name]) {
+      secrets.forEach(secret => setPath(secret, name, copyDefault(defaultValue)));
+    }
+  }
+
+  for (const [name, { encoding, values }] of Object.entries(columns)) {
+    const decode = decoders[encoding];
+    const hasDefault = Object.prototype.hasOwnProperty.call(defaults, name);
+    values.forEach((value, i) => {
+      if (value !== null) {
+        setPath(secrets[i], name, decode(value, strings));
+      } else if (hasDefault) {
+        setPath(secrets[i], name, copyDefault(defaults[name]));
+      }
+    });
+  }
+
+  return secrets;
+};